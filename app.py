@@ -1,37 +1,415 @@
-from flask import Flask, jsonify, request
+from flask import Blueprint, Flask, Response, current_app, g, has_app_context, has_request_context, jsonify, make_response, request, send_from_directory
 from dotenv import load_dotenv
-from flask_sqlalchemy import SQLAlchemy
-from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity
+from flask_sqlalchemy import SignallingSession, SQLAlchemy
+from flask_jwt_extended import JWTManager, create_access_token, current_user, jwt_required, get_jwt_identity, verify_jwt_in_request
+from flask_jwt_extended.exceptions import JWTExtendedException
+from jwt.exceptions import PyJWTError
 from flask_restx import Api, Resource
 from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import timedelta
+from sqlalchemy import DDL, bindparam, column, event, func, inspect, literal_column, select, table, text, tuple_
+from sqlalchemy import exc
+from sqlalchemy.engine import Engine
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.orm import joinedload, sessionmaker
+from sqlalchemy.pool import QueuePool
+from datetime import datetime, timedelta
+from collections import Counter, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from functools import wraps
+import atexit
+import base64
+import hashlib
+import json
+import math
+import multiprocessing
 import os
+import re
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
 from werkzeug.utils import secure_filename
 from flask_cors import CORS
+from prometheus_client import multiprocess
+from prometheus_client.mmap_dict import MmapedDict
+import click
+import prometheus_client
+
+try:
+    import redis
+except ImportError:  # opcional: só é necessário com CACHE_BACKEND=redis
+    redis = None
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # opcional: sem Pillow as fotos ficam só no tamanho original
+    Image = ImageOps = None
 
 
 UPLOAD_FOLDER = './users-profiles'
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
+UPLOAD_CHUNK_SIZE = 64 * 1024
+# Variantes geradas para cada foto: miniatura quadrada (avatares das
+# listagens) e uma versão comprimida de tamanho médio, ambas em JPEG.
+IMAGE_VARIANTS = {'thumb': (96, 96), 'medium': (512, 512)}
+IMAGE_QUALITY = 80
+IMAGE_MAX_AGE = 365 * 24 * 3600  # nomes derivados do conteúdo nunca mudam
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+SEARCH_TITLE_WEIGHT = 10.0  # peso do título em relação à descrição no BM25
+SEARCH_SCORE_WEIGHT = 0.1  # quanto cada voto positivo reforça a relevância
+MAX_BATCH_VOTES = 500
+# Feed "hot": log10 dos votos (comentários valem HOT_COMMENT_WEIGHT) somado à
+# idade; a cada HOT_DECAY_SECONDS mais nova a pergunta ganha o peso de 10x votos.
+HOT_EPOCH = datetime(2024, 1, 1)
+HOT_DECAY_SECONDS = 45000
+HOT_COMMENT_WEIGHT = 0.5
+HOT_REFRESH_OVERLAP = timedelta(seconds=30)  # cobre commits que chegam fora de ordem
 
 load_dotenv('./.env')
 
-app = Flask(__name__)
-CORS(app, resources={r"/*": {"origins": "*"}})
+def load_config(app):
+    """Configuração padrão, sobrescrita por variáveis de ambiente."""
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///database.db')
+    # Réplica opcional para as rotas somente leitura (marcadas com @read_only)
+    app.config['DATABASE_READ_URL'] = os.environ.get('DATABASE_READ_URL')
+    app.config['DB_POOL_SIZE'] = int(os.environ.get('DB_POOL_SIZE', '10'))
+    app.config['DB_MAX_OVERFLOW'] = int(os.environ.get('DB_MAX_OVERFLOW', '20'))
+    app.config['DB_POOL_TIMEOUT'] = int(os.environ.get('DB_POOL_TIMEOUT', '10'))  # segundos
+    app.config['DB_POOL_RECYCLE'] = int(os.environ.get('DB_POOL_RECYCLE', '1800'))  # segundos
+    app.config['SQLITE_BUSY_TIMEOUT'] = int(os.environ.get('SQLITE_BUSY_TIMEOUT', '5000'))  # ms
+    app.config['SQLITE_MMAP_SIZE'] = int(os.environ.get('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)))  # bytes
+    app.config['SQLITE_CACHE_SIZE'] = int(os.environ.get('SQLITE_CACHE_SIZE', str(64 * 1024)))  # KiB
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['JWT_SECRET_KEY'] = os.environ.get('JWT_SECRET_KEY', 'fallback_secret_key')  # Carregar da variável de ambiente
+    app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+    app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB Max Size
+    # Processos que geram miniaturas/variantes das fotos; 0 gera na própria requisição.
+    # Os pools são por processo: com vários workers, o gunicorn.conf.py divide as CPUs.
+    app.config['IMAGE_POOL_WORKERS'] = int(os.environ.get('IMAGE_POOL_WORKERS', '1'))
+    # Com um proxy na frente (nginx), delega o envio das imagens via X-Sendfile
+    app.config['USE_X_SENDFILE'] = os.environ.get('IMAGE_X_SENDFILE', '0') == '1'
+    app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(hours=24)
+    # Votos em buffer (write-behind): gravados em lote a cada VOTE_FLUSH_INTERVAL
+    # segundos ou quando o buffer chega à metade de VOTE_BUFFER_MAX. Cheio, o
+    # buffer recusa votos com 503. Votos ainda no buffer se perdem se o
+    # processo morrer sem shutdown limpo.
+    app.config['VOTE_BUFFERING'] = os.environ.get('VOTE_BUFFERING', '0') == '1'
+    app.config['VOTE_FLUSH_INTERVAL'] = float(os.environ.get('VOTE_FLUSH_INTERVAL', '1.0'))
+    app.config['VOTE_BUFFER_MAX'] = int(os.environ.get('VOTE_BUFFER_MAX', '1000'))
+    app.config['VOTE_FLUSH_ON_SHUTDOWN'] = os.environ.get('VOTE_FLUSH_ON_SHUTDOWN', '1') == '1'
+    # Cache das respostas de leitura: 'memory' (no processo; os outros workers
+    # podem servir respostas antigas até CACHE_TTL), 'redis' ou 'none'
+    app.config['CACHE_BACKEND'] = os.environ.get('CACHE_BACKEND', 'memory')
+    app.config['CACHE_REDIS_URL'] = os.environ.get('CACHE_REDIS_URL', 'redis://localhost:6379/0')
+    # Cliente pronto no lugar de CACHE_REDIS_URL (ex.: fakeredis.FakeRedis() via create_app(test_config))
+    app.config['CACHE_REDIS_CLIENT'] = None
+    app.config['CACHE_TTL'] = int(os.environ.get('CACHE_TTL', '300'))  # segundos
+    app.config['CACHE_MAX_ENTRIES'] = int(os.environ.get('CACHE_MAX_ENTRIES', '2048'))
+    # Hash de senhas em um pool de processos. Com HASH_POOL_WORKERS=0 o hash roda
+    # na própria thread da requisição. Senhas com método diferente de
+    # PASSWORD_HASH_METHOD são refeitas no próximo login.
+    app.config['PASSWORD_HASH_METHOD'] = os.environ.get('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:260000')
+    app.config['HASH_POOL_WORKERS'] = int(os.environ.get('HASH_POOL_WORKERS', str(min(2, os.cpu_count() or 1))))
+    app.config['HASH_POOL_MAX_PENDING'] = int(os.environ.get(
+        'HASH_POOL_MAX_PENDING', str(4 * max(app.config['HASH_POOL_WORKERS'], 1))))
+    # Cache curto de JWT identity -> User, usado por current_user
+    app.config['IDENTITY_CACHE_TTL'] = int(os.environ.get('IDENTITY_CACHE_TTL', '30'))  # segundos
+    app.config['IDENTITY_CACHE_MAX_ENTRIES'] = int(os.environ.get('IDENTITY_CACHE_MAX_ENTRIES', '10000'))
+    # Cache por usuário dos votos já consultados (viewer_vote nas listagens)
+    app.config['VOTE_STATE_CACHE_TTL'] = int(os.environ.get('VOTE_STATE_CACHE_TTL', '30'))  # segundos
+    app.config['VOTE_STATE_CACHE_MAX_ENTRIES'] = int(os.environ.get('VOTE_STATE_CACHE_MAX_ENTRIES', '10000'))
+    # Intervalo (segundos) do job que atualiza o feed hot em cada worker; 0 desliga
+    app.config['HOT_FEED_REFRESH_INTERVAL'] = float(os.environ.get('HOT_FEED_REFRESH_INTERVAL', '30'))
+    # Instrumentação: contagem de queries/tempo por requisição, Server-Timing e /metrics
+    app.config['METRICS_ENABLED'] = os.environ.get('METRICS_ENABLED', '1') == '1'
+    # Mesma query repetida mais que isso em uma requisição é registrada como N+1
+    app.config['N_PLUS_ONE_THRESHOLD'] = int(os.environ.get('N_PLUS_ONE_THRESHOLD', '10'))
+
+# ------------------ BANCO DE DADOS ------------------
+# Perfil do engine escolhido pela URL: SQLite usa WAL e um pool pequeno de
+# conexões persistentes (os PRAGMAs e o cache de páginas são por conexão);
+# bancos servidor usam um pool dimensionado com pre-ping e recycle.
+def engine_options(url, config):
+    if make_url(url).drivername.startswith('sqlite'):
+        if make_url(url).database in (None, '', ':memory:'):
+            return {}  # o Flask-SQLAlchemy já usa StaticPool em memória
+        return {
+            'poolclass': QueuePool,
+            'pool_size': config['DB_POOL_SIZE'],
+            'max_overflow': config['DB_MAX_OVERFLOW'],
+            'pool_timeout': config['DB_POOL_TIMEOUT'],
+            'connect_args': {'check_same_thread': False},
+        }
+    return {
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+        'pool_pre_ping': True,
+    }
+
+SQLITE_PRAGMA_DEFAULTS = {
+    'SQLITE_BUSY_TIMEOUT': 5000,
+    'SQLITE_MMAP_SIZE': 256 * 1024 * 1024,
+    'SQLITE_CACHE_SIZE': 64 * 1024,
+}
+
+@event.listens_for(Engine, 'connect')
+def configure_sqlite_connection(dbapi_connection, connection_record):
+    connection_record.info['pid'] = os.getpid()
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    config = current_app.config if has_app_context() else SQLITE_PRAGMA_DEFAULTS
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.execute('PRAGMA busy_timeout=%d' % config['SQLITE_BUSY_TIMEOUT'])
+    cursor.execute('PRAGMA mmap_size=%d' % config['SQLITE_MMAP_SIZE'])
+    cursor.execute('PRAGMA cache_size=-%d' % config['SQLITE_CACHE_SIZE'])
+    cursor.execute('PRAGMA temp_store=MEMORY')
+    # O SQLite só aplica as FKs (e o ON DELETE CASCADE) com isto ligado em cada conexão
+    cursor.execute('PRAGMA foreign_keys=ON')
+    cursor.close()
+
+@event.listens_for(Engine, 'checkout')
+def discard_inherited_connection(dbapi_connection, connection_record, connection_proxy):
+    # Conexões abertas antes de um fork não podem ser usadas pelo processo
+    # filho (worker): descarta e deixa o pool abrir uma nova.
+    if connection_record.info.get('pid') != os.getpid():
+        connection_record.connection = connection_proxy.connection = None
+        raise exc.DisconnectionError('Connection belongs to another process')
+
+class RoutingSession(SignallingSession):
+    """Envia as consultas das rotas @read_only para o engine de leitura."""
+
+    def __init__(self, db, **options):
+        self.db = db
+        super().__init__(db, **options)
+
+    def get_bind(self, mapper=None, clause=None):
+        if (not self._flushing and has_request_context() and g.get('read_only')
+                and 'read' in (self.app.config['SQLALCHEMY_BINDS'] or {})):
+            return self.db.get_engine(self.app, bind='read')
+        return super().get_bind(mapper, clause)
 
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///database.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['JWT_SECRET_KEY'] = os.environ.get('JWT_SECRET_KEY', 'fallback_secret_key')  # Carregar da variável de ambiente
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB Max Size
-app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(hours=24)
+class RoutingSQLAlchemy(SQLAlchemy):
+    def create_session(self, options):
+        return sessionmaker(class_=RoutingSession, db=self, **options)
 
-api = Api(app, version='1.0', title='Projeto Integrador API', description='API para simular as funcionalidades do stack overflow')
+def read_only(view):
+    """Marca uma rota que só lê do banco e pode usar a réplica de leitura."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.read_only = True
+        return view(*args, **kwargs)
+    return wrapper
+
+cors = CORS()
+api = Api(version='1.0', title='Projeto Integrador API', description='API para simular as funcionalidades do stack overflow')
 ns = api.namespace('main', description='Operações principais')
-db = SQLAlchemy(app)
-jwt = JWTManager(app)
+db = RoutingSQLAlchemy()
+jwt = JWTManager()
+bp = Blueprint('main', __name__, cli_group=None)
+
+
+# ------------------ MÉTRICAS ------------------
+# Instrumentação barata o bastante para ficar ligada em produção: os eventos
+# do engine somam queries e tempo de banco da requisição atual em `g`, e o
+# after_request alimenta contadores/histogramas do prometheus_client expostos
+# em /metrics. Com PROMETHEUS_MULTIPROC_DIR (definido pelo gunicorn.conf.py)
+# cada worker grava os valores em arquivos nesse diretório e /metrics soma os
+# de todos, inclusive os de workers já reciclados: os contadores não voltam a
+# zero nem dependem do worker que atendeu a coleta.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+
+class Metrics:
+    # Um conjunto por processo (os valores por worker ficam nos arquivos do multiprocess)
+    registry = prometheus_client.CollectorRegistry()
+    requests = prometheus_client.Counter(
+        'http_requests', 'Requests by endpoint, method and status.',
+        ['endpoint', 'method', 'status'], registry=registry)
+    latency = prometheus_client.Histogram(
+        'http_request_duration_seconds', 'Request latency in seconds.',
+        ['endpoint', 'method'], buckets=LATENCY_BUCKETS, registry=registry)
+    queries = prometheus_client.Histogram(
+        'db_queries_per_request', 'SQL statements issued per request.',
+        ['endpoint', 'method'], buckets=QUERY_COUNT_BUCKETS, registry=registry)
+    db_time = prometheus_client.Counter(
+        'db_time_seconds', 'Time spent in SQL statements.', ['endpoint', 'method'], registry=registry)
+    n_plus_one = prometheus_client.Counter(
+        'n_plus_one_requests', 'Requests that repeated one statement above the threshold.',
+        ['endpoint', 'method'], registry=registry)
+
+    def observe_request(self, endpoint, method, status, duration, query_count, db_time, n_plus_one):
+        self.requests.labels(endpoint, method, str(status)).inc()
+        self.latency.labels(endpoint, method).observe(duration)
+        self.queries.labels(endpoint, method).observe(query_count)
+        self.db_time.labels(endpoint, method).inc(db_time)
+        if n_plus_one:
+            self.n_plus_one.labels(endpoint, method).inc()
+
+    def render(self):
+        if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+            registry = prometheus_client.CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+            return prometheus_client.generate_latest(registry)
+        return prometheus_client.generate_latest(self.registry)
+
+
+def archive_worker_metrics(pid):
+    """Soma os arquivos de um worker encerrado nos arquivos de arquivo morto.
+
+    Sem isso cada worker reciclado deixa dois arquivos para trás e a coleta,
+    que lê todos, fica mais lenta a cada reciclagem. Roda no master (child_exit),
+    então não há dois processos escrevendo o mesmo arquivo de arquivo morto; a
+    troca é feita por os.replace e o arquivo do worker sai logo em seguida.
+    """
+    directory = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    for kind in ('counter', 'histogram'):
+        source = os.path.join(directory, '%s_%d.db' % (kind, pid))
+        if not os.path.exists(source):
+            continue
+        archive = os.path.join(directory, '%s_archive.db' % kind)
+        staging = archive + '.tmp'  # fora do glob *.db da coleta
+        if os.path.exists(archive):
+            shutil.copyfile(archive, staging)
+        merged = MmapedDict(staging)
+        try:
+            for key, value, _ in MmapedDict.read_all_values_from_file(source):
+                merged.write_value(key, merged.read_value(key) + value)
+        finally:
+            merged.close()
+        os.replace(staging, archive)
+        os.remove(source)
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and 'query_count' in g:
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def stop_query_timer(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and 'query_count' in g and conn.info.get('query_started'):
+        g.db_time += time.perf_counter() - conn.info['query_started'].pop()
+        g.query_count += 1
+        g.statements[statement] += 1
+
+@bp.before_app_request
+def start_request_timer():
+    if current_app.config['METRICS_ENABLED']:
+        g.request_started = time.perf_counter()
+        g.query_count = 0
+        g.db_time = 0.0
+        g.statements = Counter()
+
+@bp.after_app_request
+def record_request_metrics(response):
+    if 'request_started' not in g:
+        return response
+    duration = time.perf_counter() - g.request_started
+    endpoint = request.endpoint or 'unmatched'
+    repeated = [(sql, n) for sql, n in g.statements.items() if n > current_app.config['N_PLUS_ONE_THRESHOLD']]
+    for statement, count in repeated:
+        current_app.logger.warning('Possible N+1 on %s: statement ran %d times: %s', endpoint, count, statement)
+    current_app.extensions['metrics'].observe_request(
+        endpoint, request.method, response.status_code, duration, g.query_count, g.db_time, bool(repeated))
+    response.headers.add('Server-Timing', 'db;dur=%.2f;desc="%d queries"' % (g.db_time * 1000, g.query_count))
+    response.headers.add('Server-Timing', 'app;dur=%.2f' % (duration * 1000))
+    return response
+
+# GET - Métricas no formato do Prometheus
+@bp.route('/metrics')
+def metrics():
+    if not current_app.config['METRICS_ENABLED']:
+        return jsonify({"message": "Metrics are disabled"}), 404
+    return Response(current_app.extensions['metrics'].render(), content_type=prometheus_client.CONTENT_TYPE_LATEST)
+
+
+# ------------------ POOLS DE PROCESSOS ------------------
+class SpawnPool:
+    """ProcessPoolExecutor criado sob demanda, um por processo.
+
+    'spawn' evita herdar threads e conexões do pai, e o pid detecta o fork
+    dos workers do gunicorn (preload_app).
+    """
+
+    def __init__(self, workers):
+        self.workers = workers
+        self.lock = threading.Lock()
+        self.executor = None
+        self.pid = None
+
+    def get(self):
+        with self.lock:
+            if self.executor is None or self.pid != os.getpid():
+                self.pid = os.getpid()
+                self.executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'))
+            return self.executor
+
+
+# ------------------ SENHAS ------------------
+class ServerBusy(Exception):
+    """Recurso interno saturado; a requisição é recusada na hora com 503."""
+
+
+class HashPoolBusy(ServerBusy):
+    """A fila do pool de hashing está cheia."""
+
 
-with app.app_context():
-        db.create_all()
+class PasswordHasher:
+    """Roda o KDF de senhas em um pool de processos limitado, para não
+    prender as threads que atendem as outras requisições."""
+
+    def __init__(self, method, workers, max_pending):
+        self.method = method
+        self.workers = workers
+        self.slots = threading.BoundedSemaphore(max(max_pending, 1))
+        self.pool = SpawnPool(workers)
+        self.prefix = None
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def check(self, pwhash, password):
+        return self._run(check_password_hash, pwhash, password)
+
+    def warmup(self):
+        """Sobe os processos do pool antes do primeiro login."""
+        self.needs_rehash('')
+        if self.workers > 0:
+            executor = self.pool.get()
+            for future in [executor.submit(int) for _ in range(self.workers)]:
+                future.result()
+
+    def needs_rehash(self, pwhash):
+        if self.prefix is None:
+            # O prefixo gravado inclui o número de iterações mesmo quando o
+            # método não informa, então pegamos de um hash real.
+            self.prefix = generate_password_hash('', self.method).split('$', 1)[0]
+        return pwhash.split('$', 1)[0] != self.prefix
+
+    def _run(self, fn, *args):
+        if self.workers <= 0:
+            return fn(*args)
+        if not self.slots.acquire(blocking=False):
+            raise HashPoolBusy()
+        try:
+            future = self.pool.get().submit(fn, *args)
+        except Exception:
+            self.slots.release()
+            raise
+        future.add_done_callback(lambda _: self.slots.release())
+        return future.result()
+
+@bp.app_errorhandler(ServerBusy)
+def handle_server_busy(error):
+    response = jsonify({"message": "Server busy, try again shortly"})
+    response.headers['Retry-After'] = '1'
+    return response, 503
 
 
 # Modelos
@@ -39,21 +417,40 @@ class Question(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(100), nullable=False)
     description = db.Column(db.String(500), nullable=False)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
     likes = db.Column(db.Integer, default=0)
     dislikes = db.Column(db.Integer, default=0)
-    comments = db.relationship('Comment', backref='question', lazy=True)
-    author = db.relationship('User', backref='questions', lazy=True)
+    score = db.Column(db.Integer, default=0, nullable=False)  # likes - dislikes, mantido pelos handlers de voto
+    comment_count = db.Column(db.Integer, default=0, nullable=False)  # mantido por add_comment/delete_comment
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    # Muda em qualquer UPDATE da linha, inclusive votos e comentários: é o que o feed hot observa
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+    comments = db.relationship('Comment', backref='question', lazy=True, passive_deletes=True)
+    author = db.relationship('User', backref=db.backref('questions', passive_deletes=True), lazy=True)
+
+    __table_args__ = (
+        db.Index('ix_question_score_id', 'score', 'id'),
+        db.Index('ix_question_user_id_id', 'user_id', 'id'),
+        db.Index('ix_question_updated_at', 'updated_at'),
+    )
 
 
 class Comment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     content = db.Column(db.String(500), nullable=False)
-    question_id = db.Column(db.Integer, db.ForeignKey('question.id'), nullable=False)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    question_id = db.Column(db.Integer, db.ForeignKey('question.id', ondelete='CASCADE'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
     likes = db.Column(db.Integer, default=0)
     dislikes = db.Column(db.Integer, default=0)
-    author = db.relationship('User', backref='comments', lazy=True)  # Adicionado
+    score = db.Column(db.Integer, default=0, nullable=False)  # likes - dislikes, mantido pelos handlers de voto
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+    author = db.relationship('User', backref=db.backref('comments', passive_deletes=True), lazy=True)  # Adicionado
+
+    __table_args__ = (
+        db.Index('ix_comment_question_score_id', 'question_id', 'score', 'id'),
+        db.Index('ix_comment_user_id', 'user_id'),
+    )
 
 
 class User(db.Model):
@@ -63,69 +460,1169 @@ class User(db.Model):
     password_hash = db.Column(db.String(128))
     age = db.Column(db.Integer)
     profile_picture = db.Column(db.String(255)) # URL da imagem de perfil
-    bookmarks = db.relationship('Bookmark', backref='user', lazy=True)
+    profile_thumbnail = db.Column(db.String(255))  # URL da miniatura; None até ser gerada
+    bookmarks = db.relationship('Bookmark', backref='user', lazy=True, passive_deletes=True)
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = current_app.extensions['password_hasher'].hash(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return current_app.extensions['password_hasher'].check(self.password_hash, password)
+
+    def password_needs_rehash(self):
+        return current_app.extensions['password_hasher'].needs_rehash(self.password_hash)
     
 class UserQuestionLike(db.Model):
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
-    question_id = db.Column(db.Integer, db.ForeignKey('question.id'), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), primary_key=True)
+    question_id = db.Column(db.Integer, db.ForeignKey('question.id', ondelete='CASCADE'), primary_key=True)
     like = db.Column(db.Boolean)  # True para like, False para dislike
 
+    __table_args__ = (db.Index('ix_user_question_like_question_id', 'question_id'),)
+
 class UserCommentLike(db.Model):
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
-    comment_id = db.Column(db.Integer, db.ForeignKey('comment.id'), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), primary_key=True)
+    comment_id = db.Column(db.Integer, db.ForeignKey('comment.id', ondelete='CASCADE'), primary_key=True)
     like = db.Column(db.Boolean)  # True para like, False para dislike
 
+    __table_args__ = (db.Index('ix_user_comment_like_comment_id', 'comment_id'),)
+
 class Bookmark(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    question_id = db.Column(db.Integer, db.ForeignKey('question.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
+    question_id = db.Column(db.Integer, db.ForeignKey('question.id', ondelete='CASCADE'), nullable=False)
+
+    __table_args__ = (
+        db.Index('ux_bookmark_user_question', 'user_id', 'question_id', unique=True),
+        db.Index('ix_bookmark_user_id_id', 'user_id', 'id'),  # páginas de bookmarks por usuário
+        db.Index('ix_bookmark_question_id', 'question_id'),
+    )
+
+class HotQuestion(db.Model):
+    """Ranking materializado do feed hot, mantido por refresh_hot_feed."""
+    __tablename__ = 'hot_question'
+    question_id = db.Column(db.Integer, db.ForeignKey('question.id', ondelete='CASCADE'), primary_key=True)
+    hot = db.Column(db.Float, nullable=False)
+    question_updated_at = db.Column(db.DateTime, nullable=False)  # versão da pergunta já pontuada
+
+    __table_args__ = (
+        db.Index('ix_hot_question_hot', 'hot', 'question_id'),
+        db.Index('ix_hot_question_updated_at', 'question_updated_at'),
+    )
+
+# ------------------ BUSCA ------------------
+# Índice full-text (SQLite FTS5) sobre título e descrição das perguntas.
+# É uma tabela de conteúdo externo: os textos ficam só em `question` e os
+# triggers mantêm o índice em sincronia em inserts, updates e deletes.
+question_fts = table('question_fts', column('rowid'), column('question_fts'))
+
+SEARCH_INDEX_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS question_fts USING fts5(
+        title, description, content='question', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3')""",
+    """CREATE TRIGGER IF NOT EXISTS question_fts_ai AFTER INSERT ON question BEGIN
+        INSERT INTO question_fts(rowid, title, description) VALUES (new.id, new.title, new.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS question_fts_ad AFTER DELETE ON question BEGIN
+        INSERT INTO question_fts(question_fts, rowid, title, description) VALUES ('delete', old.id, old.title, old.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS question_fts_au AFTER UPDATE OF title, description ON question BEGIN
+        INSERT INTO question_fts(question_fts, rowid, title, description) VALUES ('delete', old.id, old.title, old.description);
+        INSERT INTO question_fts(rowid, title, description) VALUES (new.id, new.title, new.description);
+    END""",
+]
+
+for statement in SEARCH_INDEX_DDL:
+    event.listen(Question.__table__, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
+
+def build_match_query(terms, prefix=False):
+    """Converte o texto do usuário em uma consulta FTS5 segura (termos entre aspas, AND implícito)."""
+    tokens = re.findall(r'\w+', terms)
+    if not tokens:
+        return None
+    quoted = ['"%s"' % t for t in tokens]
+    if prefix:
+        quoted[-1] += '*'
+    return ' '.join(quoted)
+
+def search_relevance():
+    # bm25() é negativo (menor = mais relevante); invertemos o sinal e
+    # reforçamos pelo score de votos para ordenar de forma decrescente.
+    # O valor depende de estatísticas do corpus inteiro e dos votos, que
+    # mudam a cada escrita: o cursor guardado com ele é só aproximado (a
+    # página seguinte pode repetir ou pular resultados). Por juntar o score,
+    # a ordenação também exige pontuar todos os resultados do MATCH.
+    bm25 = func.bm25(literal_column('question_fts'), SEARCH_TITLE_WEIGHT, 1.0)
+    return -bm25 * (1.0 + SEARCH_SCORE_WEIGHT * func.max(Question.score, 0))
+
+# ------------------ CACHE ------------------
+# Cache de respostas com invalidação por tags. Cada resposta guardada
+# registra as tags de que depende e a versão de cada uma; as escritas
+# incrementam a versão das tags afetadas, e uma entrada com versão antiga é
+# tratada como ausente. Cada invalidação incrementa a geração global e
+# grava esse número como versão das tags afetadas; assim uma resposta só deixa
+# de ser guardada se uma das suas próprias tags mudou enquanto ela era
+# montada. No backend redis as versões são compartilhadas e uma escrita
+# invalida o cache de todos os workers; no memory cada worker só vê as
+# próprias escritas, e os outros podem servir a resposta antiga até CACHE_TTL.
+# Um acerto não consulta o banco. Tags usadas:
+#   'questions'      listagem e busca de perguntas (conteúdo e ordem)
+#   'question:<id>'  detalhe da pergunta <id> (texto e votos)
+#   'comments:<id>'  comentários da pergunta <id>
+#   'user:<id>'      nome/foto do autor <id> exibidos nas listagens
+class MemoryCache:
+    """Backend no próprio processo, com despejo LRU e TTL por entrada."""
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        with self.lock:
+            item = self.entries.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + self.ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+
+class LocalVersions:
+    """Versões das tags no próprio processo, usadas com o backend memory.
+
+    Guarda no máximo `max_tags` tags (LRU). Uma tag despejada passa a valer
+    `floor`, a maior versão já despejada: entradas gravadas antes dela viram
+    miss, nunca um acerto desatualizado.
+    """
+    shared = False  # outros workers não enxergam as invalidações
+
+    def __init__(self, max_tags):
+        self.max_tags = max_tags
+        self.lock = threading.Lock()
+        self.generations = {}
+        self.tags = OrderedDict()
+        self.floor = 0
+
+    def get_counters(self, keys):
+        with self.lock:
+            return [self.generations.get(k, self.tags.get(k, self.floor)) for k in keys]
+
+    def bump(self, generation_key, tags):
+        with self.lock:
+            generation = self.generations.get(generation_key, 0) + 1
+            self.generations[generation_key] = generation
+            for tag in tags:
+                self.tags[tag] = generation
+                self.tags.move_to_end(tag)
+            while len(self.tags) > self.max_tags:
+                _, version = self.tags.popitem(last=False)
+                self.floor = max(self.floor, version)
+
+
+class RedisCache:
+    """Backend compartilhado entre workers. Aceita qualquer cliente com a API
+    de get/set/mget/transaction do redis-py (ex.: fakeredis em ambiente local).
+    O despejo LRU fica a cargo do servidor (maxmemory-policy allkeys-lru)."""
+    shared = True
+
+    def __init__(self, client, ttl):
+        self.client = client
+        self.ttl = ttl
+
+    def get(self, key):
+        raw = self.client.get('cache:' + key)
+        return json.loads(raw) if raw is not None else None
+
+    def set(self, key, value):
+        self.client.set('cache:' + key, json.dumps(value), ex=self.ttl)
+
+    def get_counters(self, keys):
+        return [int(v or 0) for v in self.client.mget(['cache-version:' + k for k in keys])]
+
+    def bump(self, generation_key, tags):
+        generation_key = 'cache-version:' + generation_key
+
+        def apply(pipe):
+            generation = int(pipe.get(generation_key) or 0) + 1
+            pipe.multi()
+            pipe.mset({generation_key: generation, **{'cache-version:' + t: generation for t in tags}})
+        # WATCH na geração: se outra invalidação passar na frente, refaz.
+        self.client.transaction(apply, generation_key)
+
+
+class ResponseCache:
+    ALL = '*'  # contador global, incrementado em toda invalidação
+
+    def __init__(self, backend, versions):
+        self.backend = backend  # entradas (get/set)
+        self.versions = versions  # versões das tags (get_counters/bump)
+
+    def lookup(self, key):
+        entry = self.backend.get(key)
+        if entry is None:
+            return None
+        tags = list(entry['tags'])
+        if self.versions.get_counters(tags) != [entry['tags'][t] for t in tags]:
+            return None
+        return entry
+
+    def generation(self):
+        return self.versions.get_counters([self.ALL])[0]
+
+    def tag_version(self, tag):
+        return self.versions.get_counters([tag])[0]
+
+    def store(self, key, body, etag, tags, generation):
+        tags = sorted(tags)
+        # Tag invalidada depois do início da montagem (versão acima da geração
+        # lida antes): a resposta pode estar desatualizada, não guarda.
+        versions = self.versions.get_counters(tags)
+        if any(v > generation for v in versions):
+            return
+        self.backend.set(key, {'body': body, 'etag': etag, 'tags': dict(zip(tags, versions))})
+
+    def invalidate(self, *tags):
+        self.versions.bump(self.ALL, sorted(set(tags)))
+
+
+def create_response_cache(config):
+    backend = config['CACHE_BACKEND']
+    if backend == 'none':
+        return None
+    if backend == 'redis':
+        client = config['CACHE_REDIS_CLIENT']
+        if client is None:
+            if redis is None:
+                raise RuntimeError("CACHE_BACKEND=redis requires the 'redis' package")
+            client = redis.Redis.from_url(config['CACHE_REDIS_URL'])
+        backend = RedisCache(client, config['CACHE_TTL'])
+        return ResponseCache(backend, backend)
+    # Cada entrada depende de poucas tags; guarda versões para algumas vezes o número de entradas
+    return ResponseCache(MemoryCache(config['CACHE_MAX_ENTRIES'], config['CACHE_TTL']),
+                         LocalVersions(4 * config['CACHE_MAX_ENTRIES']))
+
+def get_response_cache():
+    return current_app.extensions.get('response_cache')
+
+def cache_tags(*tags):
+    """Registra as tags das quais a resposta em montagem depende."""
+    if 'cache_tags' in g:
+        g.cache_tags.update(tags)
+
+def invalidate_cache(*tags):
+    response_cache = get_response_cache()
+    if response_cache is not None and tags:
+        response_cache.invalidate(*tags)
+
+def cached_response(view):
+    """Serve respostas GET do cache, com ETag forte e 304 para If-None-Match.
+
+    Se `g.personalize` estiver definido, ele recebe o corpo compartilhado e
+    devolve a versão do usuário; o cache guarda só o corpo compartilhado.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        response_cache = get_response_cache()
+        personalize = g.get('personalize')
+        if response_cache is None and personalize is None:
+            return view(*args, **kwargs)
+        key = request.full_path
+        entry = response_cache.lookup(key) if response_cache is not None else None
+        if entry is None:
+            generation = response_cache.generation() if response_cache is not None else None
+            g.cache_tags = set()
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+            body = response.get_data(as_text=True)
+            etag = hashlib.sha1(response.get_data()).hexdigest()
+            if response_cache is not None:
+                response_cache.store(key, body, etag, g.cache_tags, generation)
+        else:
+            body, etag = entry['body'], entry['etag']
+        if personalize is not None:
+            body = personalize(body)
+            etag = hashlib.sha1(body.encode()).hexdigest()
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            response = Response(body, mimetype='application/json')
+        response.set_etag(etag)
+        return response
+    return wrapper
+
+# Cache de identidade: evita um SELECT em `user` por requisição autenticada.
+# Guarda instâncias desanexadas da sessão e as reanexa sem consulta. Cada
+# entrada leva a versão da tag 'user:<id>' do cache de respostas: com versões
+# compartilhadas (redis), uma alteração ou exclusão da conta em qualquer
+# worker invalida a entrada em todos. Sem elas, os outros workers seguem com
+# a entrada até IDENTITY_CACHE_TTL; as escritas de uma conta apagada são
+# barradas pelas FKs (404), e quem mostra dados do usuário numa escrita
+# (POST /questions) busca do banco.
+def get_cached_user(user_id):
+    identity_cache = current_app.extensions['identity_cache']
+    response_cache = get_response_cache()
+    shared = response_cache is not None and response_cache.versions.shared
+    version = response_cache.tag_version('user:%d' % user_id) if shared else None
+    entry = identity_cache.get(user_id)
+    if entry is None or entry[1] != version:
+        user = User.query.get(user_id)
+        if user is None:
+            identity_cache.delete(user_id)
+            return None
+        db.session.expunge(user)
+        entry = (user, version)
+        identity_cache.set(user_id, entry)
+    return db.session.merge(entry[0], load=False)
+
+@jwt.user_lookup_loader
+def load_current_user(jwt_header, jwt_data):
+    return get_cached_user(jwt_data[current_app.config['JWT_IDENTITY_CLAIM']])
+
+# ------------------ VOTOS ------------------
+# Cada voto é uma única transação curta: insert-if-absent na tabela de votos
+# e incremento dos contadores direto no SQL (likes = likes + 1), sem ler a
+# linha antes. Assim não há corrida entre SELECT e INSERT nem lost update.
+VOTE_CREATED = 'created'
+VOTE_CHANGED = 'changed'
+VOTE_UNCHANGED = 'unchanged'
+
+def insert_ignore(table):
+    """INSERT que não faz nada se a chave primária já existir."""
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+        return insert(table).on_conflict_do_nothing()
+    if dialect == 'mysql':
+        return table.insert().prefix_with('IGNORE')
+    return table.insert().prefix_with('OR IGNORE')
+
+def apply_vote_delta(target_model, target_id, likes=0, dislikes=0):
+    target = target_model.__table__
+    result = db.session.execute(
+        target.update()
+        .where(target.c.id == target_id)
+        .values(likes=target.c.likes + likes,
+                dislikes=target.c.dislikes + dislikes,
+                score=target.c.score + likes - dislikes))
+    return result.rowcount
+
+def invalidate_vote_targets(target_model, target_ids):
+    if get_response_cache() is None or not target_ids:
+        return
+    if target_model is Question:
+        invalidate_cache('questions', *['question:%d' % q for q in target_ids])
+    else:
+        question_ids = {row[0] for row in db.session.execute(
+            select([Comment.question_id]).where(Comment.id.in_(list(target_ids))))}
+        invalidate_cache(*['comments:%d' % q for q in question_ids])
+
+def record_vote(vote_model, target_column, user_id, target_id, like):
+    """Grava o voto sem commit; retorna (VOTE_*, delta dos contadores)."""
+    votes = vote_model.__table__
+    key = (votes.c.user_id == user_id) & (votes.c[target_column] == target_id)
+    inserted = db.session.execute(
+        insert_ignore(votes).values({'user_id': user_id, target_column: target_id, 'like': like})).rowcount
+    if inserted:
+        return VOTE_CREATED, ({'likes': 1} if like else {'dislikes': 1})
+    # Já existe voto: só troca se for o oposto do atual.
+    changed = db.session.execute(
+        votes.update().where(key & (votes.c.like != like)).values(like=like)).rowcount
+    if not changed:
+        return VOTE_UNCHANGED, None
+    return VOTE_CHANGED, ({'likes': 1, 'dislikes': -1} if like else {'likes': -1, 'dislikes': 1})
+
+def cast_vote(vote_model, target_model, target_column, user_id, target_id, like):
+    """Registra um like/dislike; retorna VOTE_* ou None se o alvo (ou o usuário) não existir."""
+    try:
+        status, delta = record_vote(vote_model, target_column, user_id, target_id, like)
+    except exc.IntegrityError:
+        db.session.rollback()
+        return None
+    if status == VOTE_UNCHANGED:
+        db.session.rollback()
+        return status
+    if not apply_vote_delta(target_model, target_id, **delta):
+        db.session.rollback()
+        return None
+    db.session.commit()
+    invalidate_vote_targets(target_model, [target_id])
+    forget_vote_state(vote_model, [user_id])
+    return status
+
+def retract_vote(vote_model, target_model, target_column, user_id, target_id):
+    """Remove o voto do usuário e desfaz o contador; retorna False se não havia voto."""
+    votes = vote_model.__table__
+    key = (votes.c.user_id == user_id) & (votes.c[target_column] == target_id)
+    for like, delta in ((True, {'likes': -1}), (False, {'dislikes': -1})):
+        if db.session.execute(votes.delete().where(key & (votes.c.like == like))).rowcount:
+            apply_vote_delta(target_model, target_id, **delta)
+            db.session.commit()
+            invalidate_vote_targets(target_model, [target_id])
+            forget_vote_state(vote_model, [user_id])
+            return True
+    db.session.rollback()
+    return False
+
+# Votos em lote: `votes` mapeia (user_id, target_id) -> like. Os votos vão
+# para a tabela com executemany e cada alvo recebe um único UPDATE com a
+# soma dos deltas, tudo em uma transação.
+VOTE_TARGETS = {
+    'question': (UserQuestionLike, Question, 'question_id'),
+    'comment': (UserCommentLike, Comment, 'comment_id'),
+}
+
+def plan_vote_batch(votes, current):
+    """Separa o lote em votos novos e trocas, comparando com os votos atuais."""
+    new_votes, flips, deltas = [], [], {}
+    for (user_id, target_id), like in votes.items():
+        previous = current.get((user_id, target_id))
+        if previous is None:
+            new_votes.append((user_id, target_id, like))
+            likes, dislikes = (1, 0) if like else (0, 1)
+        elif previous != like:
+            flips.append((user_id, target_id, like))
+            likes, dislikes = (1, -1) if like else (-1, 1)
+        else:
+            continue
+        total = deltas.setdefault(target_id, [0, 0])
+        total[0] += likes
+        total[1] += dislikes
+    return new_votes, flips, deltas
+
+def write_vote_batch(votes_table, target_column, new_votes, flips):
+    """Grava o lote com executemany; retorna False se outra escrita concorrente interferiu."""
+    if new_votes:
+        inserted = db.session.execute(
+            insert_ignore(votes_table),
+            [{'user_id': u, target_column: t, 'like': like} for u, t, like in new_votes]).rowcount
+        if inserted != len(new_votes):
+            return False
+    if flips:
+        flip = (votes_table.update()
+                .where((votes_table.c.user_id == bindparam('b_user_id'))
+                       & (votes_table.c[target_column] == bindparam('b_target_id'))
+                       & (votes_table.c.like != bindparam('b_like')))
+                .values(like=bindparam('b_like')))
+        changed = db.session.execute(
+            flip, [{'b_user_id': u, 'b_target_id': t, 'b_like': like} for u, t, like in flips]).rowcount
+        if changed != len(flips):
+            return False
+    return True
+
+def apply_vote_batch(kind, votes):
+    """Aplica um lote de votos de um tipo; retorna quantos votos foram criados ou trocados."""
+    vote_model, target_model, target_column = VOTE_TARGETS[kind]
+    votes_table, target = vote_model.__table__, target_model.__table__
+    # Alvos e usuários apagados depois do voto (ex.: votos ainda no buffer) são
+    # ignorados; os dois conjuntos saem de uma única consulta.
+    user = User.__table__
+    found = {(kind, id_) for kind, id_ in db.session.execute(
+        select([literal_column("'target'"), target.c.id]).where(target.c.id.in_({t for _, t in votes}))
+        .union_all(select([literal_column("'user'"), user.c.id]).where(user.c.id.in_({u for u, _ in votes}))))}
+    votes = {(u, t): like for (u, t), like in votes.items() if ('target', t) in found and ('user', u) in found}
+    if not votes:
+        return 0
+    current = dict((((u, t), like) for u, t, like in db.session.execute(
+        select([votes_table.c.user_id, votes_table.c[target_column], votes_table.c.like])
+        .where(tuple_(votes_table.c.user_id, votes_table.c[target_column]).in_(list(votes))))))
+    new_votes, flips, deltas = plan_vote_batch(votes, current)
+    applied = len(new_votes) + len(flips)
+    if not write_vote_batch(votes_table, target_column, new_votes, flips):
+        # Outro processo votou entre a leitura e a escrita: refaz voto a voto.
+        db.session.rollback()
+        applied, deltas = 0, {}
+        for (user_id, target_id), like in votes.items():
+            status, delta = record_vote(vote_model, target_column, user_id, target_id, like)
+            if status == VOTE_UNCHANGED:
+                continue
+            applied += 1
+            total = deltas.setdefault(target_id, [0, 0])
+            total[0] += delta.get('likes', 0)
+            total[1] += delta.get('dislikes', 0)
+    if deltas:
+        db.session.execute(
+            target.update().where(target.c.id == bindparam('b_id')).values(
+                likes=target.c.likes + bindparam('b_likes'),
+                dislikes=target.c.dislikes + bindparam('b_dislikes'),
+                score=target.c.score + bindparam('b_likes') - bindparam('b_dislikes')),
+            [{'b_id': t, 'b_likes': l, 'b_dislikes': d} for t, (l, d) in deltas.items()])
+    db.session.commit()
+    invalidate_vote_targets(target_model, list(deltas))
+    forget_vote_state(vote_model, {u for u, _ in votes})
+    return applied
+
+class VoteBufferFull(ServerBusy):
+    """O buffer de votos atingiu VOTE_BUFFER_MAX (ex.: banco travado)."""
+
+
+class VoteBuffer:
+    """Acumula votos em memória e grava em lote em uma thread de fundo.
+
+    Dentro de uma janela vale o último voto de cada usuário em cada alvo.
+    Com `max_size` votos aguardando, novos votos são recusados até a
+    gravação liberar espaço; a gravação antecipada começa na metade.
+    """
+
+    def __init__(self, app, interval, max_size):
+        self.app = app
+        self.interval = interval
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.pending = {kind: {} for kind in VOTE_TARGETS}
+        self.size = 0
+        self.thread = None
+        self.pid = None
+        self.stopped = False
+
+    def add(self, kind, user_id, target_id, like):
+        self.add_many({kind: {(user_id, target_id): like}})
+
+    def add_many(self, batches):
+        """Enfileira {kind: {(user_id, target_id): like}} inteiro ou nada.
+
+        Levanta VoteBufferFull se os votos novos não couberem no buffer.
+        """
+        with self.lock:
+            added = sum(1 for kind, votes in batches.items() for key in votes if key not in self.pending[kind])
+            if added and self.size + added > self.max_size:
+                raise VoteBufferFull()
+            for kind, votes in batches.items():
+                self.pending[kind].update(votes)
+            self.size += added
+            flush_early = self.size >= self.max_size // 2
+            self._ensure_thread()
+        if flush_early:
+            self.wakeup.set()
+
+    def discard(self, kind, user_id, target_id):
+        """Tira do buffer um voto ainda não gravado; retorna True se havia."""
+        with self.lock:
+            if self.pending[kind].pop((user_id, target_id), None) is None:
+                return False
+            self.size -= 1
+            return True
+
+    def pending_for(self, kind, user_id, target_ids):
+        """Votos ainda não gravados do usuário entre target_ids."""
+        with self.lock:
+            bucket = self.pending[kind]
+            return {t: bucket[(user_id, t)] for t in target_ids if (user_id, t) in bucket}
+
+    def flush(self):
+        with self.flush_lock:
+            with self.lock:
+                batches = self.pending
+                self.pending = {kind: {} for kind in VOTE_TARGETS}
+                self.size = 0
+            with self.app.app_context():
+                for kind, votes in batches.items():
+                    if not votes:
+                        continue
+                    try:
+                        apply_vote_batch(kind, votes)
+                    except Exception:
+                        db.session.rollback()
+                        self.app.logger.exception('Vote flush failed; requeueing %d votes', len(votes))
+                        self._requeue(kind, votes)
+                    finally:
+                        db.session.remove()
+
+    def stop(self):
+        self.stopped = True
+        self.wakeup.set()
+        if self.thread is not None and self.pid == os.getpid():
+            self.thread.join()
+        self.flush()
+
+    def _requeue(self, kind, votes):
+        # Votos já aceitos não são descartados: o buffer pode passar de
+        # max_size até a próxima gravação dar certo, e enquanto isso add() recusa.
+        with self.lock:
+            bucket = self.pending[kind]
+            for key, like in votes.items():
+                if key not in bucket:
+                    bucket[key] = like
+                    self.size += 1
+
+    def _ensure_thread(self):
+        # A thread é criada no primeiro voto de cada processo (seguro após fork).
+        if self.thread is None or self.pid != os.getpid():
+            self.pid = os.getpid()
+            self.thread = threading.Thread(target=self._run, name='vote-flusher', daemon=True)
+            self.thread.start()
+
+    def _run(self):
+        while not self.stopped:
+            self.wakeup.wait(self.interval)
+            self.wakeup.clear()
+            self.flush()
+
+def get_vote_buffer():
+    return current_app.extensions.get('vote_buffer')
+
+# Estado de voto do usuário logado nas listagens. Cada página custa no máximo
+# um SELECT ... IN na tabela de votos; o resultado fica num cache por usuário
+# (no processo) e é descartado quando o próprio usuário vota.
+def vote_state_key(vote_model, user_id):
+    return '%s:%d' % (vote_model.__tablename__, user_id)
+
+def forget_vote_state(vote_model, user_ids):
+    vote_state_cache = current_app.extensions['vote_state_cache']
+    for user_id in user_ids:
+        vote_state_cache.delete(vote_state_key(vote_model, user_id))
+
+def get_vote_state(kind, user_id, target_ids):
+    """Retorna {target_id: True/False/None} com o voto do usuário em cada alvo."""
+    vote_model, _, target_column = VOTE_TARGETS[kind]
+    vote_state_cache = current_app.extensions['vote_state_cache']
+    key = vote_state_key(vote_model, user_id)
+    known = dict(vote_state_cache.get(key) or {})
+    missing = [t for t in target_ids if t not in known]
+    if missing:
+        votes = vote_model.__table__
+        found = dict(db.session.execute(
+            select([votes.c[target_column], votes.c.like])
+            .where((votes.c.user_id == user_id) & votes.c[target_column].in_(missing))).fetchall())
+        for target_id in missing:
+            known[target_id] = found.get(target_id)
+        vote_state_cache.set(key, known)
+    state = {t: known[t] for t in target_ids}
+    vote_buffer = get_vote_buffer()
+    if vote_buffer is not None:
+        state.update(vote_buffer.pending_for(kind, user_id, target_ids))
+    return state
+
+def with_viewer_votes(kind):
+    """Com JWT válido, acrescenta `viewer_vote` ('like', 'dislike' ou null) a cada item da página.
+
+    Vai acima de @cached_response: o corpo em cache continua igual para todos.
+    As rotas são públicas, então um token expirado, malformado ou de um
+    usuário apagado não dá erro: a resposta sai como a anônima.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            try:
+                verify_jwt_in_request(optional=True)
+                user_id = get_jwt_identity()
+            except (JWTExtendedException, PyJWTError):
+                user_id = None
+            if user_id is not None:
+                def personalize(body):
+                    data = json.loads(body)
+                    state = get_vote_state(kind, user_id, [item['id'] for item in data['items']])
+                    for item in data['items']:
+                        like = state.get(item['id'])
+                        item['viewer_vote'] = None if like is None else ('like' if like else 'dislike')
+                    return jsonify(data).get_data(as_text=True)
+                g.personalize = personalize
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+# ------------------ FEED HOT ------------------
+# O ranking só depende de votos, comentários e data de criação, então não
+# precisa ser recalculado com o passar do tempo: basta repontuar as perguntas
+# cujo updated_at mudou desde a última rodada. /questions/hot lê a tabela
+# hot_question pelo índice (hot, question_id).
+def hot_rank(score, comment_count, created_at):
+    activity = score + HOT_COMMENT_WEIGHT * comment_count
+    sign = (activity > 0) - (activity < 0)
+    age = (created_at - HOT_EPOCH).total_seconds()
+    return sign * math.log10(max(abs(activity), 1)) + age / HOT_DECAY_SECONDS
+
+def hot_feed_watermark():
+    return db.session.execute(select([func.max(HotQuestion.__table__.c.question_updated_at)])).scalar()
+
+def refresh_hot_feed(full=False):
+    """Repontua as perguntas alteradas desde a última rodada; retorna quantas.
+
+    A marca d'água compara horários gravados pelos servidores de aplicação:
+    uma pergunta com updated_at mais antigo que ela menos HOT_REFRESH_OVERLAP
+    (commit atrasado, relógios fora de sincronia) só é repontuada com
+    `full`, que ignora a marca d'água.
+    """
+    question, hot = Question.__table__, HotQuestion.__table__
+    watermark = None if full else hot_feed_watermark()
+    query = (select([question.c.id, question.c.score, question.c.comment_count,
+                     question.c.created_at, question.c.updated_at])
+             .select_from(question.outerjoin(hot, hot.c.question_id == question.c.id))
+             .where((hot.c.question_updated_at == None)  # noqa: E711
+                    | (hot.c.question_updated_at != question.c.updated_at)))
+    if watermark is not None:
+        query = query.where(question.c.updated_at > watermark - HOT_REFRESH_OVERLAP)
+    rows = [{'question_id': question_id, 'hot': hot_rank(score, comment_count or 0, created_at),
+             'question_updated_at': updated_at}
+            for question_id, score, comment_count, created_at, updated_at in db.session.execute(query)]
+    if not rows:
+        return 0  # nada mudou desde a rodada anterior (deste ou de outro worker)
+    # UPDATE das que já existem + INSERT das novas: seguro com vários workers
+    # rodando o job. Uma rodada que leu dados mais antigos e commita depois de
+    # outra não volta a versão gravada: as linhas só andam para frente.
+    db.session.execute(
+        hot.update().where((hot.c.question_id == bindparam('b_question_id'))
+                           & (hot.c.question_updated_at < bindparam('b_question_updated_at')))
+        .values(hot=bindparam('b_hot'), question_updated_at=bindparam('b_question_updated_at')),
+        [{'b_' + k: v for k, v in row.items()} for row in rows])
+    db.session.execute(insert_ignore(hot), rows)
+    db.session.commit()
+    # Com o backend redis invalida o feed em todos os workers, inclusive pelo
+    # cron (flask refresh-hot-feed); no memory, só neste processo.
+    invalidate_cache('hot')
+    return len(rows)
+
+class HotFeedRefresher:
+    """Roda refresh_hot_feed a cada `interval` segundos em uma thread do worker.
+
+    Se outro worker já repontuou o feed, o cache local de 'hot' (backend
+    memory) é invalidado quando a marca d'água da tabela muda.
+    """
+
+    def __init__(self, app, interval):
+        self.app = app
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.thread = None
+        self.pid = None
+        self.watermark = None
+
+    def start(self):
+        # Uma thread por processo, criada no warmup (depois do fork); pode ser chamado mais de uma vez.
+        with self.lock:
+            if self.thread is None or self.pid != os.getpid():
+                self.pid = os.getpid()
+                self.thread = threading.Thread(target=self._run, name='hot-feed-refresher', daemon=True)
+                self.thread.start()
+
+    def stop(self):
+        self.wakeup.set()
+
+    def _run(self):
+        while not self.wakeup.wait(self.interval):
+            with self.app.app_context():
+                try:
+                    refresh_hot_feed()
+                    watermark = hot_feed_watermark()
+                    if watermark != self.watermark:
+                        self.watermark = watermark
+                        invalidate_cache('hot')
+                except Exception:
+                    db.session.rollback()
+                    self.app.logger.exception('Hot feed refresh failed')
+                finally:
+                    db.session.remove()
+
+# ------------------ EXCLUSÕES ------------------
+# Exclusões em conjunto: cada nível é um DELETE ... WHERE ... IN (SELECT ...),
+# sem carregar objetos filhos na sessão. As FKs também declaram ON DELETE
+# CASCADE, mas os DELETEs explícitos valem mesmo em tabelas criadas antes das
+# cascatas. Como as FKs são aplicadas (no SQLite, PRAGMA foreign_keys), um
+# insert que chega depois da exclusão da conta ou da pergunta falha com
+# IntegrityError, e as rotas respondem 404 em vez de gravar linhas órfãs.
+def purge_comments(condition, adjust_counts=True):
+    """Apaga os comentários que satisfazem `condition` e os votos neles."""
+    comment, question = Comment.__table__, Question.__table__
+    comment_likes = UserCommentLike.__table__
+    db.session.execute(comment_likes.delete().where(
+        comment_likes.c.comment_id.in_(select([comment.c.id]).where(condition))))
+    if adjust_counts:
+        removed = (select([func.count()]).where(condition & (comment.c.question_id == question.c.id))
+                   .as_scalar())
+        db.session.execute(
+            question.update()
+            .where(question.c.id.in_(select([comment.c.question_id]).where(condition)))
+            .values(comment_count=question.c.comment_count - removed))
+    db.session.execute(comment.delete().where(condition))
+
+def purge_questions(condition):
+    """Apaga as perguntas que satisfazem `condition` com tudo que depende delas."""
+    question = Question.__table__
+    question_ids = select([question.c.id]).where(condition)
+    purge_comments(Comment.__table__.c.question_id.in_(question_ids), adjust_counts=False)
+    for model in (UserQuestionLike, Bookmark, HotQuestion):
+        table = model.__table__
+        db.session.execute(table.delete().where(table.c.question_id.in_(question_ids)))
+    db.session.execute(question.delete().where(condition))
+
+def retract_user_votes(user_id):
+    """Remove todos os votos do usuário, desfazendo os contadores dos alvos."""
+    for vote_model, target_model, target_column in VOTE_TARGETS.values():
+        votes, target = vote_model.__table__, target_model.__table__
+        for like, delta in ((True, {'likes': -1}), (False, {'dislikes': -1})):
+            voted = select([votes.c[target_column]]).where((votes.c.user_id == user_id) & (votes.c.like == like))
+            likes, dislikes = delta.get('likes', 0), delta.get('dislikes', 0)
+            db.session.execute(
+                target.update().where(target.c.id.in_(voted))
+                .values(likes=target.c.likes + likes,
+                        dislikes=target.c.dislikes + dislikes,
+                        score=target.c.score + likes - dislikes))
+        db.session.execute(votes.delete().where(votes.c.user_id == user_id))
+
+def purge_user(user_id):
+    """Apaga a conta e todo o conteúdo do usuário.
+
+    Retorna (perguntas cujos comentários mudaram, perguntas cujos votos mudaram).
+    """
+    comment, comment_likes = Comment.__table__, UserCommentLike.__table__
+    question_likes = UserQuestionLike.__table__
+    # Perguntas de outros usuários afetadas por comentários ou votos em comentários deste usuário
+    touched = {row[0] for row in db.session.execute(
+        select([comment.c.question_id]).where(comment.c.user_id == user_id)
+        .union(select([comment.c.question_id])
+               .where(comment.c.id.in_(select([comment_likes.c.comment_id])
+                                       .where(comment_likes.c.user_id == user_id)))))}
+    voted = {row[0] for row in db.session.execute(
+        select([question_likes.c.question_id]).where(question_likes.c.user_id == user_id))}
+    purge_questions(Question.__table__.c.user_id == user_id)
+    retract_user_votes(user_id)
+    purge_comments(comment.c.user_id == user_id)
+    bookmark = Bookmark.__table__
+    db.session.execute(bookmark.delete().where(bookmark.c.user_id == user_id))
+    user = User.__table__
+    db.session.execute(user.delete().where(user.c.id == user_id))
+    return touched, voted
+
+def purge_orphans():
+    """Remove linhas que apontam para perguntas, comentários ou usuários inexistentes."""
+    question, comment, user = Question.__table__, Comment.__table__, User.__table__
+    users = select([user.c.id])
+    purge_questions(~question.c.user_id.in_(users))
+    purge_comments(~comment.c.question_id.in_(select([question.c.id])) | ~comment.c.user_id.in_(users),
+                   adjust_counts=False)
+    comment_likes = UserCommentLike.__table__
+    db.session.execute(comment_likes.delete().where(
+        ~comment_likes.c.comment_id.in_(select([comment.c.id])) | ~comment_likes.c.user_id.in_(users)))
+    for model in (UserQuestionLike, Bookmark, HotQuestion):
+        table = model.__table__
+        orphan = ~table.c.question_id.in_(select([question.c.id]))
+        if 'user_id' in table.c:
+            orphan = orphan | ~table.c.user_id.in_(users)
+        db.session.execute(table.delete().where(orphan))
+
+# ------------------ IMAGENS ------------------
+# Fotos de perfil são gravadas pelo SHA-256 do conteúdo (uploads iguais viram
+# um arquivo só) e servidas em /images com cache imutável. Miniatura e versão
+# comprimida são geradas em um pool de processos depois da resposta.
+def upload_dir():
+    return os.path.abspath(current_app.config['UPLOAD_FOLDER'])
+
+def image_name(digest, suffix):
+    return '%s/%s%s' % (digest[:2], digest, suffix)
+
+def image_url(name):
+    return '/images/' + name
+
+def avatar_url(user):
+    """Miniatura para as listagens; cai para a foto original enquanto ela não existe."""
+    return user.profile_thumbnail or user.profile_picture
+
+def is_image(path):
+    """Confere com o Pillow se o arquivo é uma imagem legível; sem Pillow, aceita."""
+    if Image is None:
+        return True
+    try:
+        with Image.open(path) as image:
+            image.verify()
+    except (OSError, SyntaxError, ValueError, Image.DecompressionBombError):
+        return False
+    return True
+
+def store_upload(stream, extension):
+    """Grava o upload em blocos, calculando o hash no caminho.
+
+    Retorna (digest, nome), ou None se o conteúdo não for uma imagem.
+    """
+    directory = upload_dir()
+    os.makedirs(directory, exist_ok=True)
+    sha256 = hashlib.sha256()
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as tmp:
+            for chunk in iter(lambda: stream.read(UPLOAD_CHUNK_SIZE), b''):
+                sha256.update(chunk)
+                tmp.write(chunk)
+        digest = sha256.hexdigest()
+        name = image_name(digest, '.' + extension)
+        path = os.path.join(directory, name)
+        if os.path.exists(path):
+            os.unlink(tmp_path)  # mesmo conteúdo já gravado (e já validado)
+        elif not is_image(tmp_path):
+            os.unlink(tmp_path)
+            return None
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    return digest, name
+
+def render_image_variants(directory, name, digest):
+    """Gera as variantes de IMAGE_VARIANTS ao lado do original (roda no pool)."""
+    with Image.open(os.path.join(directory, name)) as source:
+        image = ImageOps.exif_transpose(source)
+        if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+            image = image.convert('RGBA')
+            flattened = Image.new('RGB', image.size, (255, 255, 255))
+            flattened.paste(image, mask=image.split()[-1])
+            image = flattened
+        else:
+            image = image.convert('RGB')
+    for variant, size in IMAGE_VARIANTS.items():
+        if variant == 'thumb':
+            resized = ImageOps.fit(image, size, Image.LANCZOS)
+        else:
+            resized = image.copy()
+            resized.thumbnail(size, Image.LANCZOS)
+        target = os.path.join(directory, image_name(digest, '-%s.jpg' % variant))
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(target), suffix='.part')
+        with os.fdopen(fd, 'wb') as tmp:
+            resized.save(tmp, 'JPEG', quality=IMAGE_QUALITY, optimize=True, progressive=True)
+        os.replace(tmp_path, target)
+    return image_name(digest, '-thumb.jpg')
+
+def set_profile_thumbnail(user_id, picture_url, thumbnail_url):
+    """Grava a miniatura se o usuário ainda estiver com a mesma foto."""
+    user = User.__table__
+    db.session.execute(
+        user.update().where((user.c.id == user_id) & (user.c.profile_picture == picture_url))
+        .values(profile_thumbnail=thumbnail_url))
+    db.session.commit()
+    invalidate_cache('user:%d' % user_id)
+    current_app.extensions['identity_cache'].delete(user_id)
+
+class ImageProcessor:
+    """Roda render_image_variants em um pool de processos e grava a miniatura no usuário ao terminar."""
+
+    def __init__(self, app, workers):
+        self.app = app
+        self.workers = workers
+        self.pool = SpawnPool(workers)
+
+    @property
+    def enabled(self):
+        return Image is not None
+
+    @property
+    def deferred(self):
+        """True se as variantes ficam prontas depois da resposta (no pool)."""
+        return self.enabled and self.workers > 0
+
+    def submit(self, user_id, picture_url, name, digest):
+        """Agenda as variantes; retorna a URL da miniatura se ela já ficou pronta (sem pool).
+
+        Sem pool, uma falha ao gerar é registrada no log e retorna None: a
+        foto original continua valendo.
+        """
+        if not self.enabled:
+            return None
+        directory = upload_dir()
+        if not self.deferred:
+            try:
+                thumbnail_url = image_url(render_image_variants(directory, name, digest))
+            except (OSError, SyntaxError, ValueError):
+                self.app.logger.exception('Image processing failed for user %s', user_id)
+                return None
+            set_profile_thumbnail(user_id, picture_url, thumbnail_url)
+            return thumbnail_url
+        future = self.pool.get().submit(render_image_variants, directory, name, digest)
+        future.add_done_callback(lambda done: self._finish(done, user_id, picture_url))
+        return None
+
+    def _finish(self, future, user_id, picture_url):
+        try:
+            thumbnail = future.result()
+        except Exception:
+            self.app.logger.exception('Image processing failed for user %s', user_id)
+            return
+        with self.app.app_context():
+            try:
+                set_profile_thumbnail(user_id, picture_url, image_url(thumbnail))
+            except exc.SQLAlchemyError:
+                db.session.rollback()
+                self.app.logger.exception('Could not store thumbnail for user %s', user_id)
+            finally:
+                db.session.remove()
+
+# ------------------ PAGINAÇÃO ------------------
+# Paginação por cursor (keyset): o cursor guarda os valores de ordenação do
+# último item da página, e a próxima página começa logo depois dele.
+def encode_cursor(values):
+    raw = json.dumps(list(values), separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    padded = cursor + '=' * (-len(cursor) % 4)
+    try:
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(values, list) or not all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in values):
+        return None
+    return values
+
+def get_page_args():
+    """Lê `limit` e `cursor` da query string; retorna None se forem inválidos."""
+    limit = request.args.get('limit', DEFAULT_PAGE_SIZE, type=int)
+    if limit is None or limit < 1:
+        return None
+    limit = min(limit, MAX_PAGE_SIZE)
+    cursor = request.args.get('cursor')
+    if cursor is None:
+        return limit, None
+    values = decode_cursor(cursor)
+    if values is None:
+        return None
+    return limit, values
+
+def keyset_page(query, columns, key, limit, after=None):
+    """Retorna (itens, próximo cursor) ordenando por `columns` em ordem decrescente.
+
+    `key` extrai de cada item os mesmos valores de `columns`, usados no cursor.
+    """
+    if after is not None:
+        if len(after) != len(columns):
+            return [], None
+        query = query.filter(tuple_(*columns) < tuple_(*after))
+    rows = query.order_by(*[c.desc() for c in columns]).limit(limit + 1).all()
+    items = rows[:limit]
+    next_cursor = encode_cursor(key(items[-1])) if len(rows) > limit else None
+    return items, next_cursor
+
+def score_sort_key(row):
+    """Cursor das listagens ordenadas por (score, id), de perguntas ou comentários."""
+    return [row.score, row.id]
+
+def page_response(items, next_cursor):
+    return jsonify({'items': items, 'next_cursor': next_cursor})
+
+def question_item(q):
+    """Pergunta como aparece nas listagens (autor carregado com joinedload)."""
+    return {
+        'id': q.id,
+        'title': q.title,
+        'description': q.description,
+        'author_name': q.author.name,
+        'author_profile_picture': avatar_url(q.author)
+    }
 
 # ------------------ QUESTIONS ------------------
 # GET - Listar Todas as Perguntas
-@app.route('/questions', methods=['GET'])
+@bp.route('/questions', methods=['GET'])
+@with_viewer_votes('question')
+@cached_response
+@read_only
 def get_questions():
-    questions = Question.query.order_by((Question.likes - Question.dislikes).desc()).all()
-    questions_data = [
-        {
-            'title': q.title,
-            'description': q.description,
-            'author_name': q.author.name,
-            'author_profile_picture': q.author.profile_picture
-        }
-        for q in questions
-    ]
-    return jsonify(questions_data)
+    page = get_page_args()
+    if page is None:
+        return jsonify({"message": "Invalid pagination parameters"}), 400
+    limit, after = page
+    query = Question.query.options(joinedload(Question.author))
+    questions, next_cursor = keyset_page(
+        query, [Question.score, Question.id], score_sort_key, limit, after)
+    cache_tags('questions', *['user:%d' % q.user_id for q in questions])
+    return page_response([question_item(q) for q in questions], next_cursor)
 
 # GET - Buscar Perguntas por Título
-@app.route('/questions/search', methods=['GET'])
+@bp.route('/questions/search', methods=['GET'])
+@with_viewer_votes('question')
+@cached_response
+@read_only
 def search_questions():
-    title_query = request.args.get('title', '')
-    questions = Question.query.filter(Question.title.like(f'%{title_query}%')).order_by((Question.likes - Question.dislikes).desc()).all()
-    questions_data = [
-        {
-            'id': q.id,
-            'title': q.title,
-            'description': q.description,
-            'author_name': q.author.name,
-            'author_profile_picture': q.author.profile_picture
-        }
-        for q in questions
-    ]
-    return jsonify(questions_data)
+    page = get_page_args()
+    if page is None:
+        return jsonify({"message": "Invalid pagination parameters"}), 400
+    limit, after = page
+    if 'q' in request.args and db.engine.dialect.name == 'sqlite':
+        match = build_match_query(request.args['q'], prefix=request.args.get('mode') == 'prefix')
+        if match is None:
+            cache_tags('questions')
+            return page_response([], None)
+        relevance = search_relevance()
+        query = (Question.query.options(joinedload(Question.author))
+                 .join(question_fts, question_fts.c.rowid == Question.id)
+                 .filter(question_fts.c.question_fts.op('MATCH')(match))
+                 .add_columns(relevance))
+        rows, next_cursor = keyset_page(
+            query, [relevance, Question.id], lambda row: [row[1], row[0].id], limit, after)
+        questions = [q for q, _ in rows]
+    else:
+        title_query = request.args.get('title', request.args.get('q', ''))
+        query = Question.query.options(joinedload(Question.author)).filter(Question.title.like(f'%{title_query}%'))
+        questions, next_cursor = keyset_page(
+            query, [Question.score, Question.id], score_sort_key, limit, after)
+    cache_tags('questions', *['user:%d' % q.user_id for q in questions])
+    return page_response([question_item(q) for q in questions], next_cursor)
+
+# GET - Feed Hot (ranking com decaimento pela idade, lido da tabela materializada)
+@bp.route('/questions/hot', methods=['GET'])
+@with_viewer_votes('question')
+@cached_response
+@read_only
+def get_hot_questions():
+    page = get_page_args()
+    if page is None:
+        return jsonify({"message": "Invalid pagination parameters"}), 400
+    limit, after = page
+    query = (Question.query.options(joinedload(Question.author))
+             .join(HotQuestion, HotQuestion.question_id == Question.id)
+             .add_columns(HotQuestion.hot))
+    rows, next_cursor = keyset_page(
+        query, [HotQuestion.hot, HotQuestion.question_id], lambda row: [row[1], row[0].id], limit, after)
+    questions = [q for q, _ in rows]
+    cache_tags('hot', *['user:%d' % q.user_id for q in questions])
+    return page_response([question_item(q) for q in questions], next_cursor)
+
+# GET - Detalhe da Pergunta (autor, contagem e primeira página de comentários)
+@bp.route('/questions/<int:question_id>', methods=['GET'])
+@cached_response
+@read_only
+def get_question(question_id):
+    page = get_page_args()
+    if page is None:
+        return jsonify({"message": "Invalid pagination parameters"}), 400
+    limit, _ = page
+    question = Question.query.options(joinedload(Question.author)).get(question_id)
+    if not question:
+        return jsonify({"message": "Question not found"}), 404
+    cache_tags('question:%d' % question_id, 'user:%d' % question.user_id)
+    comments, next_cursor = comments_page(question_id, limit)
+    return jsonify({
+        **question_item(question),
+        'likes': question.likes,
+        'dislikes': question.dislikes,
+        'comment_count': question.comment_count,
+        'comments': {'items': comments, 'next_cursor': next_cursor}
+    })
 
 # POST - Adicionar Pergunta
-@app.route('/questions', methods=['POST'])
+@bp.route('/questions', methods=['POST'])
 @jwt_required(optional=True)
 def add_question():
     question_data = request.json
     user_id = get_jwt_identity()
-    user = User.query.get(user_id)
+    # Relido do banco (o current_user do cache pode estar na sessão): a resposta mostra nome e foto atuais
+    user = User.query.populate_existing().get(user_id) if user_id is not None else None
     if not user:
         return jsonify({"message": "User not found"}), 404
     
@@ -135,19 +1632,27 @@ def add_question():
         user_id=user_id
     )
     db.session.add(new_question)
-    db.session.commit()
+    try:
+        db.session.flush()
+    except exc.IntegrityError:  # conta apagada depois da checagem do token
+        db.session.rollback()
+        return jsonify({"message": "User not found"}), 404
 
     # Agora, retorne os dados da nova pergunta, incluindo o nome do autor e a imagem de perfil
-    return jsonify({
+    # (montados antes do commit, que expira os objetos e forçaria novos SELECTs)
+    question_json = {
         'id': new_question.id,
         'title': new_question.title,
         'description': new_question.description,
         'author_name': user.name,
-        'author_profile_picture': user.profile_picture if user.profile_picture else 'default_profile_url'
-    }), 201
+        'author_profile_picture': avatar_url(user) or 'default_profile_url'
+    }
+    db.session.commit()
+    invalidate_cache('questions')
+    return jsonify(question_json), 201
 
 # PUT - Atualizar Pergunta
-@app.route('/questions/<int:question_id>', methods=['PUT'])
+@bp.route('/questions/<int:question_id>', methods=['PUT'])
 @jwt_required()
 def update_question(question_id):
     current_user_id = get_jwt_identity()
@@ -158,10 +1663,11 @@ def update_question(question_id):
     question.title = data.get('title', question.title)
     question.description = data.get('description', question.description)
     db.session.commit()
+    invalidate_cache('questions', 'question:%d' % question_id)
     return jsonify({"message": "Question updated successfully"})
 
 # DELETE - Deletar Pergunta
-@app.route('/questions/<int:question_id>', methods=['DELETE'])
+@bp.route('/questions/<int:question_id>', methods=['DELETE'])
 @jwt_required()
 def delete_question(question_id):
     current_user_id = get_jwt_identity()
@@ -174,69 +1680,108 @@ def delete_question(question_id):
     if question.user_id != current_user_id:
         return jsonify({"message": "Unauthorized"}), 403
 
-    db.session.delete(question)
+    purge_questions(Question.__table__.c.id == question_id)
     db.session.commit()
+    invalidate_cache('questions', 'hot', 'question:%d' % question_id, 'comments:%d' % question_id)
     return jsonify({"message": "Question deleted successfully"}), 200
 
 
 # POST - Dar Like em Pergunta
-@app.route('/questions/<int:question_id>/like', methods=['POST'])
+@bp.route('/questions/<int:question_id>/like', methods=['POST'])
 @jwt_required()
 def like_question(question_id):
-    current_user_id = get_jwt_identity()
-    existing_like = UserQuestionLike.query.filter_by(user_id=current_user_id, question_id=question_id).first()
-    if existing_like:
+    vote_buffer = get_vote_buffer()
+    if vote_buffer is not None:
+        vote_buffer.add('question', get_jwt_identity(), question_id, True)
+        return jsonify({"message": "Vote accepted"}), 202
+    result = cast_vote(UserQuestionLike, Question, 'question_id', get_jwt_identity(), question_id, True)
+    if result is None:
+        return jsonify({"message": "Question not found"}), 404
+    if result == VOTE_UNCHANGED:
         return jsonify({"message": "Already liked/disliked"}), 409
-    new_like = UserQuestionLike(user_id=current_user_id, question_id=question_id, like=True)
-    db.session.add(new_like)
-    question = Question.query.get_or_404(question_id)
-    question.likes += 1
-    db.session.commit()
     return jsonify({"message": "Liked question successfully"})
 
 # POST - Dar Dislike em Pergunta
-@app.route('/questions/<int:question_id>/dislike', methods=['POST'])
+@bp.route('/questions/<int:question_id>/dislike', methods=['POST'])
 @jwt_required()
 def dislike_question(question_id):
-    current_user_id = get_jwt_identity()
-    existing_like = UserQuestionLike.query.filter_by(user_id=current_user_id, question_id=question_id).first()
-    if existing_like:
+    vote_buffer = get_vote_buffer()
+    if vote_buffer is not None:
+        vote_buffer.add('question', get_jwt_identity(), question_id, False)
+        return jsonify({"message": "Vote accepted"}), 202
+    result = cast_vote(UserQuestionLike, Question, 'question_id', get_jwt_identity(), question_id, False)
+    if result is None:
+        return jsonify({"message": "Question not found"}), 404
+    if result == VOTE_UNCHANGED:
         return jsonify({"message": "Already liked/disliked"}), 409
-    new_like = UserQuestionLike(user_id=current_user_id, question_id=question_id, like=False)
-    db.session.add(new_like)
-    question = Question.query.get_or_404(question_id)
-    question.dislikes += 1
-    db.session.commit()
     return jsonify({"message": "Disliked question successfully"})
 
+# DELETE - Remover Voto em Pergunta
+@bp.route('/questions/<int:question_id>/vote', methods=['DELETE'])
+@jwt_required()
+def retract_question_vote(question_id):
+    user_id = get_jwt_identity()
+    vote_buffer = get_vote_buffer()
+    pending = vote_buffer is not None and vote_buffer.discard('question', user_id, question_id)
+    if not retract_vote(UserQuestionLike, Question, 'question_id', user_id, question_id) and not pending:
+        return jsonify({"message": "Vote not found"}), 404
+    return jsonify({"message": "Vote removed successfully"})
+
 # ------------------ COMMENTS ------------------
-# GET - Listar Comentários de uma Pergunta
-@app.route('/questions/<int:question_id>/comments', methods=['GET'])
-def get_comments(question_id):
-    comments = Comment.query.filter_by(question_id=question_id).order_by((Comment.likes - Comment.dislikes).desc()).all()
+# Página de comentários, compartilhada com o detalhe da pergunta
+def comments_page(question_id, limit, after=None):
+    query = Comment.query.options(joinedload(Comment.author)).filter_by(question_id=question_id)
+    comments, next_cursor = keyset_page(
+        query, [Comment.score, Comment.id], score_sort_key, limit, after)
+    cache_tags('comments:%d' % question_id, *['user:%d' % c.user_id for c in comments])
     comments_data = [
         {
+            'id': c.id,
             'content': c.content,
             'author_name': c.author.name,
-            'author_profile_picture': c.author.profile_picture
+            'author_profile_picture': avatar_url(c.author)
         }
         for c in comments
     ]
-    return jsonify(comments_data)
+    return comments_data, next_cursor
+
+# GET - Listar Comentários de uma Pergunta
+@bp.route('/questions/<int:question_id>/comments', methods=['GET'])
+@with_viewer_votes('comment')
+@cached_response
+@read_only
+def get_comments(question_id):
+    page = get_page_args()
+    if page is None:
+        return jsonify({"message": "Invalid pagination parameters"}), 400
+    limit, after = page
+    return page_response(*comments_page(question_id, limit, after))
 
 # POST - Adicionar Comentário
-@app.route('/questions/<int:question_id>/comments', methods=['POST'])
+@bp.route('/questions/<int:question_id>/comments', methods=['POST'])
 @jwt_required()
 def add_comment(question_id):
     comment_data = request.json
     user_id = get_jwt_identity()
+    question = Question.__table__
+    counted = db.session.execute(
+        question.update().where(question.c.id == question_id)
+        .values(comment_count=question.c.comment_count + 1)).rowcount
+    if not counted:
+        db.session.rollback()
+        return jsonify({"message": "Question not found"}), 404
     new_comment = Comment(content=comment_data['content'], question_id=question_id, user_id=user_id)
     db.session.add(new_comment)
-    db.session.commit()
+    try:
+        db.session.commit()
+    except exc.IntegrityError:  # a pergunta existe (contador atualizado): é a conta que foi apagada
+        db.session.rollback()
+        return jsonify({"message": "User not found"}), 404
+    invalidate_cache('comments:%d' % question_id)
     return jsonify({"message": "Comment added successfully"})
 
 # PUT - Atualizar Comentário
-@app.route('/comments/<int:comment_id>', methods=['PUT'])
+@bp.route('/comments/<int:comment_id>', methods=['PUT'])
 @jwt_required()
 def update_comment(comment_id):
     current_user_id = get_jwt_identity()
@@ -246,10 +1791,11 @@ def update_comment(comment_id):
     data = request.json
     comment.content = data.get('content', comment.content)
     db.session.commit()
+    invalidate_cache('comments:%d' % comment.question_id)
     return jsonify({"message": "Comment updated successfully"})
 
 # DELETE - Deletar Comentário
-@app.route('/comments/<int:comment_id>', methods=['DELETE'])
+@bp.route('/comments/<int:comment_id>', methods=['DELETE'])
 @jwt_required()
 def delete_comment(comment_id):
     current_user_id = get_jwt_identity()
@@ -262,44 +1808,82 @@ def delete_comment(comment_id):
     if comment.user_id != current_user_id:
         return jsonify({"message": "Unauthorized"}), 403
 
-    db.session.delete(comment)
+    question_id = comment.question_id
+    purge_comments(Comment.__table__.c.id == comment_id)
     db.session.commit()
+    invalidate_cache('comments:%d' % question_id)
     return jsonify({"message": "Comment deleted successfully"}), 200
 
 
 # POST - Dar Like em Comentário
-@app.route('/comments/<int:comment_id>/like', methods=['POST'])
+@bp.route('/comments/<int:comment_id>/like', methods=['POST'])
 @jwt_required()
 def like_comment(comment_id):
-    current_user_id = get_jwt_identity()
-    existing_like = UserCommentLike.query.filter_by(user_id=current_user_id, comment_id=comment_id).first()
-    if existing_like:
+    vote_buffer = get_vote_buffer()
+    if vote_buffer is not None:
+        vote_buffer.add('comment', get_jwt_identity(), comment_id, True)
+        return jsonify({"message": "Vote accepted"}), 202
+    result = cast_vote(UserCommentLike, Comment, 'comment_id', get_jwt_identity(), comment_id, True)
+    if result is None:
+        return jsonify({"message": "Comment not found"}), 404
+    if result == VOTE_UNCHANGED:
         return jsonify({"message": "Already liked/disliked this comment"}), 409
-    new_like = UserCommentLike(user_id=current_user_id, comment_id=comment_id, like=True)
-    db.session.add(new_like)
-    comment = Comment.query.get_or_404(comment_id)
-    comment.likes += 1
-    db.session.commit()
     return jsonify({"message": "Liked comment successfully"})
 
 # POST - Dar Dislike em Comentário
-@app.route('/comments/<int:comment_id>/dislike', methods=['POST'])
+@bp.route('/comments/<int:comment_id>/dislike', methods=['POST'])
 @jwt_required()
 def dislike_comment(comment_id):
-    current_user_id = get_jwt_identity()
-    existing_like = UserCommentLike.query.filter_by(user_id=current_user_id, comment_id=comment_id).first()
-    if existing_like:
+    vote_buffer = get_vote_buffer()
+    if vote_buffer is not None:
+        vote_buffer.add('comment', get_jwt_identity(), comment_id, False)
+        return jsonify({"message": "Vote accepted"}), 202
+    result = cast_vote(UserCommentLike, Comment, 'comment_id', get_jwt_identity(), comment_id, False)
+    if result is None:
+        return jsonify({"message": "Comment not found"}), 404
+    if result == VOTE_UNCHANGED:
         return jsonify({"message": "Already liked/disliked this comment"}), 409
-    new_like = UserCommentLike(user_id=current_user_id, comment_id=comment_id, like=False)
-    db.session.add(new_like)
-    comment = Comment.query.get_or_404(comment_id)
-    comment.dislikes += 1
-    db.session.commit()
     return jsonify({"message": "Disliked comment successfully"})
 
+# DELETE - Remover Voto em Comentário
+@bp.route('/comments/<int:comment_id>/vote', methods=['DELETE'])
+@jwt_required()
+def retract_comment_vote(comment_id):
+    user_id = get_jwt_identity()
+    vote_buffer = get_vote_buffer()
+    pending = vote_buffer is not None and vote_buffer.discard('comment', user_id, comment_id)
+    if not retract_vote(UserCommentLike, Comment, 'comment_id', user_id, comment_id) and not pending:
+        return jsonify({"message": "Vote not found"}), 404
+    return jsonify({"message": "Vote removed successfully"})
+
+# ------------------ VOTOS EM LOTE ------------------
+# POST - Votar em Lote
+@bp.route('/votes', methods=['POST'])
+@jwt_required()
+def batch_votes():
+    data = request.json or {}
+    votes = data.get('votes')
+    vote_buffer = get_vote_buffer()
+    # No modo em buffer, um lote maior que o buffer nunca caberia (503 para sempre)
+    max_votes = min(MAX_BATCH_VOTES, vote_buffer.max_size) if vote_buffer is not None else MAX_BATCH_VOTES
+    if not isinstance(votes, list) or len(votes) > max_votes:
+        return jsonify({"message": f"'votes' must be a list of at most {max_votes} votes"}), 400
+    user_id = get_jwt_identity()
+    batches = {kind: {} for kind in VOTE_TARGETS}
+    for vote in votes:
+        if (not isinstance(vote, dict) or vote.get('type') not in VOTE_TARGETS
+                or type(vote.get('id')) is not int or not isinstance(vote.get('like'), bool)):
+            return jsonify({"message": "Each vote needs 'type' (question|comment), integer 'id' and boolean 'like'"}), 400
+        batches[vote['type']][(user_id, vote['id'])] = vote['like']
+    if vote_buffer is not None:
+        vote_buffer.add_many(batches)
+        return jsonify({"message": "Votes accepted", "accepted": sum(len(b) for b in batches.values())}), 202
+    applied = sum(apply_vote_batch(kind, batch) for kind, batch in batches.items() if batch)
+    return jsonify({"message": "Votes applied", "applied": applied})
+
 # ------------------ USERS ------------------
 # POST - Registrar Usuário
-@app.route('/register', methods=['POST'])
+@bp.route('/register', methods=['POST'])
 def register():
     data = request.json
     if data['password'] != data['confirm_password']:
@@ -311,17 +1895,20 @@ def register():
     return jsonify({"message": "User registered successfully"}), 201
 
 # POST - Login do Usuário
-@app.route('/login', methods=['POST'])
+@bp.route('/login', methods=['POST'])
 def login():
     data = request.json
     user = User.query.filter_by(email=data['email']).first()
     if user and user.check_password(data['password']):
+        if user.password_needs_rehash():
+            user.set_password(data['password'])
+            db.session.commit()
         access_token = create_access_token(identity=user.id)
         return jsonify(access_token=access_token), 200
     return jsonify({"message": "Invalid credentials"}), 401
 
 # PUT - Atualizar Usuário
-@app.route('/user/<int:user_id>', methods=['PUT'])
+@bp.route('/user/<int:user_id>', methods=['PUT'])
 @jwt_required()
 def update_user(user_id):
     user = User.query.get(user_id)
@@ -333,38 +1920,73 @@ def update_user(user_id):
     if 'password' in data:
         user.set_password(data['password'])
     db.session.commit()
+    invalidate_cache('user:%d' % user_id)
+    current_app.extensions['identity_cache'].delete(user_id)
     return jsonify({"message": "User updated successfully"}), 200
 
+# DELETE - Excluir Conta (apaga perguntas, comentários, votos e bookmarks do usuário)
+@bp.route('/user/<int:user_id>', methods=['DELETE'])
+@jwt_required()
+def delete_user(user_id):
+    if get_jwt_identity() != user_id:
+        return jsonify({"message": "Unauthorized access"}), 403
+    if not current_user:
+        return jsonify({"message": "User not found"}), 404
+    touched, voted = purge_user(user_id)
+    db.session.commit()
+    invalidate_cache('questions', 'hot', 'user:%d' % user_id,
+                     *['comments:%d' % q for q in touched], *['question:%d' % q for q in voted])
+    current_app.extensions['identity_cache'].delete(user_id)
+    for vote_model, _, _ in VOTE_TARGETS.values():
+        forget_vote_state(vote_model, [user_id])
+    return jsonify({"message": "User deleted successfully"}), 200
+
+# Páginas de bookmarks e histórico, compartilhadas com o dashboard
+def bookmarks_page(user_id, limit, after=None):
+    query = (db.session.query(Bookmark.id, Question.id, Question.title, Question.description)
+             .join(Question, Question.id == Bookmark.question_id)
+             .filter(Bookmark.user_id == user_id))
+    rows, next_cursor = keyset_page(query, [Bookmark.id], lambda row: [row[0]], limit, after)
+    items = [{'question_id': question_id, 'title': title, 'description': description}
+             for _, question_id, title, description in rows]
+    return items, next_cursor
+
+def history_page(user_id, limit, after=None):
+    query = Question.query.filter_by(user_id=user_id)
+    questions, next_cursor = keyset_page(query, [Question.id], lambda q: [q.id], limit, after)
+    return [{'title': q.title, 'description': q.description} for q in questions], next_cursor
+
 # GET - Visualizar Bookmarks do Usuário
-@app.route('/user/<int:user_id>/bookmarks', methods=['GET'])
+@bp.route('/user/<int:user_id>/bookmarks', methods=['GET'])
 @jwt_required()
+@read_only
 def view_bookmarks(user_id):
     current_user_id = get_jwt_identity()
     if current_user_id != user_id:
         return jsonify({"message": "Unauthorized access"}), 403
-    bookmarks = Bookmark.query.filter_by(user_id=user_id).all()
-    bookmarked_questions = [Question.query.get(bm.question_id) for bm in bookmarks]
-    bookmarked_questions_data = [
-        {
-            'question_id': q.id,
-            'title': q.title,
-            'description': q.description
-        }
-        for q in bookmarked_questions if q is not None
-    ]
-    return jsonify(bookmarked_questions_data)
+    page = get_page_args()
+    if page is None:
+        return jsonify({"message": "Invalid pagination parameters"}), 400
+    limit, after = page
+    return page_response(*bookmarks_page(user_id, limit, after))
 
 # POST - Adicionar Bookmark
-@app.route('/user/<int:user_id>/bookmark/<int:question_id>', methods=['POST'])
+@bp.route('/user/<int:user_id>/bookmark/<int:question_id>', methods=['POST'])
 @jwt_required()
 def add_bookmark(user_id, question_id):
-    new_bookmark = Bookmark(user_id=user_id, question_id=question_id)
-    db.session.add(new_bookmark)
+    try:
+        inserted = db.session.execute(
+            insert_ignore(Bookmark.__table__).values(user_id=user_id, question_id=question_id)).rowcount
+    except exc.IntegrityError:
+        db.session.rollback()
+        return jsonify({"message": "User or question not found"}), 404
     db.session.commit()
+    if not inserted:
+        return jsonify({"message": "Bookmark already exists"}), 409
     return jsonify({"message": "Bookmark added successfully"}), 201
 
 # DELETE - Remover Bookmark
-@app.route('/user/<int:user_id>/bookmark/<int:question_id>', methods=['DELETE'])
+@bp.route('/user/<int:user_id>/bookmark/<int:question_id>', methods=['DELETE'])
 @jwt_required()
 def remove_bookmark(user_id, question_id):
     bookmark = Bookmark.query.filter_by(user_id=user_id, question_id=question_id).first()
@@ -375,14 +1997,60 @@ def remove_bookmark(user_id, question_id):
     return jsonify({"message": "Bookmark not found"}), 404
 
 # GET - Visualizar Histórico de Perguntas do Usuário
-@app.route('/user/<int:user_id>/history', methods=['GET'])
+@bp.route('/user/<int:user_id>/history', methods=['GET'])
 @jwt_required()
+@read_only
 def view_history(user_id):
     user = User.query.get(user_id)
     if not user:
         return jsonify({"message": "User not found"}), 404
-    questions = Question.query.filter_by(user_id=user_id).all()
-    return jsonify([{'title': q.title, 'description': q.description} for q in questions])
+    page = get_page_args()
+    if page is None:
+        return jsonify({"message": "Invalid pagination parameters"}), 400
+    limit, after = page
+    return page_response(*history_page(user_id, limit, after))
+
+# GET - Dashboard do Usuário (perfil, histórico, bookmarks e contagens em uma chamada)
+@bp.route('/user/<int:user_id>/dashboard', methods=['GET'])
+@jwt_required()
+@read_only
+def view_dashboard(user_id):
+    if get_jwt_identity() != user_id:
+        return jsonify({"message": "Unauthorized access"}), 403
+    user = current_user
+    if not user:
+        return jsonify({"message": "User not found"}), 404
+    page = get_page_args()
+    if page is None:
+        return jsonify({"message": "Invalid pagination parameters"}), 400
+    limit, _ = page
+    history, history_cursor = history_page(user_id, limit)
+    bookmarks, bookmarks_cursor = bookmarks_page(user_id, limit)
+    # Todas as contagens em uma única consulta, cada uma servida por um índice em user_id
+    counts = db.session.execute(select([
+        select([func.count()]).where(Question.user_id == user_id).as_scalar(),
+        select([func.count()]).where(Comment.user_id == user_id).as_scalar(),
+        select([func.count()]).where(UserQuestionLike.user_id == user_id).as_scalar(),
+        select([func.count()]).where(UserCommentLike.user_id == user_id).as_scalar(),
+    ])).first()
+    return jsonify({
+        'profile': {
+            'id': user.id,
+            'name': user.name,
+            'email': user.email,
+            'age': user.age,
+            'profile_picture': user.profile_picture,
+            'profile_thumbnail': user.profile_thumbnail
+        },
+        'history': {'items': history, 'next_cursor': history_cursor},
+        'bookmarks': {'items': bookmarks, 'next_cursor': bookmarks_cursor},
+        'counts': {
+            'questions': counts[0],
+            'comments': counts[1],
+            'question_votes': counts[2],
+            'comment_votes': counts[3]
+        }
+    })
 
 
 # Função allowed_file e rota de upload de imagem de perfil
@@ -390,33 +2058,58 @@ def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-@app.route('/upload/<int:user_id>', methods=['POST'])
+@bp.route('/upload/<int:user_id>', methods=['POST'])
 @jwt_required()
 def upload_file(user_id):
+    if get_jwt_identity() != user_id:
+        return jsonify({"message": "Unauthorized access"}), 403
     if 'file' not in request.files:
         return jsonify({"message": "No file part"}), 400
     file = request.files['file']
     if file.filename == '':
         return jsonify({"message": "No selected file"}), 400
-    if file and allowed_file(file.filename):
-        filename = secure_filename(file.filename)
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(file_path)
-        relative_path = os.path.join('users-profiles', filename)  # Salva caminho relativo
+    filename = secure_filename(file.filename)
+    if not allowed_file(filename):
+        return jsonify({"message": "File type not allowed"}), 400
+    user = User.query.get(user_id)
+    if not user:
+        return jsonify({"message": "User not found"}), 404
 
-        user = User.query.get(user_id)
-        if not user:
-            return jsonify({"message": "User not found"}), 404
-        
-        user.profile_picture = relative_path
-        db.session.commit()
-        return jsonify({"message": "File uploaded successfully"}), 200
+    stored = store_upload(file.stream, filename.rsplit('.', 1)[1].lower())
+    if stored is None:
+        return jsonify({"message": "File is not a valid image"}), 400
+    digest, name = stored
+    thumbnail = image_name(digest, '-thumb.jpg')
+    # Conteúdo já enviado antes (por qualquer usuário): as variantes já existem
+    ready = os.path.exists(os.path.join(upload_dir(), thumbnail))
+    user.profile_picture = image_url(name)
+    user.profile_thumbnail = image_url(thumbnail) if ready else None
+    body = {'profile_picture': user.profile_picture, 'profile_thumbnail': user.profile_thumbnail}
+    db.session.commit()
+    invalidate_cache('user:%d' % user_id)
+    current_app.extensions['identity_cache'].delete(user_id)
+    image_processor = current_app.extensions['image_processor']
+    if not ready and image_processor.enabled:
+        body['profile_thumbnail'] = image_processor.submit(user_id, body['profile_picture'], name, digest)
+        # 202 só quando a miniatura ainda vai ser gravada pelo pool
+        if body['profile_thumbnail'] is None and image_processor.deferred:
+            return jsonify({"message": "File uploaded, thumbnail pending", **body}), 202
+    return jsonify({"message": "File uploaded successfully", **body}), 200
+
+# GET - Imagens enviadas (nomes pelo hash do conteúdo, então o cache pode ser eterno).
+# O arquivo vai pelo wsgi.file_wrapper, que no gunicorn usa sendfile(); com
+# IMAGE_X_SENDFILE=1 o envio fica com o proxy.
+@bp.route('/images/<path:name>')
+def serve_image(name):
+    response = send_from_directory(upload_dir(), name, max_age=IMAGE_MAX_AGE, etag=name.replace('/', '-'))
+    response.headers['Cache-Control'] = 'public, max-age=%d, immutable' % IMAGE_MAX_AGE
+    return response
 
 import os
 
-@app.route('/dbpath')
+@bp.route('/dbpath')
 def db_path():
-    db_uri = app.config['SQLALCHEMY_DATABASE_URI']
+    db_uri = current_app.config['SQLALCHEMY_DATABASE_URI']
     if db_uri.startswith('sqlite:///'):
         db_path = db_uri.split('sqlite:///')[-1]
         return os.path.abspath(db_path)
@@ -424,7 +2117,229 @@ def db_path():
         return "O banco de dados não está usando SQLite."
 
 
+# Sem o post_worker_init do gunicorn (ex.: `flask run`), o warmup roda na
+# primeira requisição de cada processo; se falhar, não é repetido.
+warmup_lock = threading.Lock()
+
+@bp.before_app_request
+def warmup_on_first_request():
+    app = current_app._get_current_object()
+    if app.extensions.get('warmup_pid') != os.getpid():
+        with warmup_lock:
+            if app.extensions.get('warmup_pid') != os.getpid():
+                warmup(app)
+
+# GET - Readiness do worker (200 só depois do warmup)
+@bp.route('/ready')
+def ready():
+    if not current_app.extensions.get('ready'):
+        return jsonify({"status": "warming up"}), 503
+    return jsonify({"status": "ready"})
+
+
+# ------------------ MANUTENÇÃO ------------------
+def add_score_columns(conn):
+    """Adiciona a coluna score onde faltar; retorna as tabelas alteradas."""
+    inspector = inspect(conn)
+    added = []
+    for model in (Question, Comment):
+        table = model.__tablename__
+        columns = {c['name'] for c in inspector.get_columns(table)}
+        if 'score' not in columns:
+            conn.execute(text(f'ALTER TABLE {table} ADD COLUMN score INTEGER NOT NULL DEFAULT 0'))
+            added.append(table)
+    return added
+
+def dedupe_bookmarks(conn):
+    """Remove bookmarks repetidos (mantém o mais antigo) antes do índice único."""
+    conn.execute(text(
+        'DELETE FROM bookmark WHERE id NOT IN '
+        '(SELECT MIN(id) FROM bookmark GROUP BY user_id, question_id)'))
+
+def create_missing_indexes(conn, tables=None):
+    inspector = inspect(conn)
+    for table in tables or db.Model.metadata.sorted_tables:
+        existing = {i['name'] for i in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(bind=conn)
+
+def fill_scores(conn, tables):
+    for table in tables:
+        conn.execute(text(f'UPDATE {table} SET score = COALESCE(likes, 0) - COALESCE(dislikes, 0)'))
+
+def add_comment_count_column(conn):
+    """Adiciona question.comment_count se faltar; retorna True se foi adicionada."""
+    columns = {c['name'] for c in inspect(conn).get_columns(Question.__tablename__)}
+    if 'comment_count' in columns:
+        return False
+    conn.execute(text('ALTER TABLE question ADD COLUMN comment_count INTEGER NOT NULL DEFAULT 0'))
+    return True
+
+def add_timestamp_columns(conn):
+    """Adiciona created_at/updated_at onde faltarem, preenchidos com o horário da migração."""
+    inspector = inspect(conn)
+    now = datetime.utcnow()
+    for model in (Question, Comment):
+        table = model.__table__
+        columns = {c['name'] for c in inspector.get_columns(table.name)}
+        missing = [name for name in ('created_at', 'updated_at') if name not in columns]
+        for name in missing:
+            conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {name} DATETIME'))
+        if missing:
+            conn.execute(table.update().values(created_at=now, updated_at=now))
+
+def add_profile_thumbnail_column(conn):
+    columns = {c['name'] for c in inspect(conn).get_columns(User.__tablename__)}
+    if 'profile_thumbnail' not in columns:
+        table = conn.dialect.identifier_preparer.format_table(User.__table__)  # "user" é reservado no PostgreSQL
+        conn.execute(text(f'ALTER TABLE {table} ADD COLUMN profile_thumbnail VARCHAR(255)'))
+
+def fill_comment_counts(conn):
+    conn.execute(text(
+        'UPDATE question SET comment_count = '
+        '(SELECT COUNT(*) FROM comment WHERE comment.question_id = question.id)'))
+
+def create_search_index(conn):
+    """Cria o índice full-text e seus triggers se faltarem; retorna True se o índice foi criado agora."""
+    if conn.dialect.name != 'sqlite':
+        return False
+    created = 'question_fts' not in inspect(conn).get_table_names()
+    for statement in SEARCH_INDEX_DDL:
+        conn.execute(text(statement))
+    return created
+
+# Cria as tabelas que faltam e aplica as alterações de schema pendentes.
+# Deve rodar uma vez por deploy, antes de subir os workers:
+#   flask migrate
+@bp.cli.command('migrate')
+def migrate():
+    db.create_all()
+    with db.engine.begin() as conn:
+        fill_scores(conn, add_score_columns(conn))
+        if add_comment_count_column(conn):
+            fill_comment_counts(conn)
+        add_timestamp_columns(conn)
+        add_profile_thumbnail_column(conn)
+        dedupe_bookmarks(conn)
+        create_missing_indexes(conn)
+        if create_search_index(conn):
+            conn.execute(text("INSERT INTO question_fts(question_fts) VALUES ('rebuild')"))
+    print('Database schema is up to date.')
+
+# Backfill único da coluna score para bancos criados antes dela existir:
+#   flask backfill-score
+@bp.cli.command('backfill-score')
+def backfill_score():
+    with db.engine.begin() as conn:
+        add_score_columns(conn)
+        fill_scores(conn, [Question.__tablename__, Comment.__tablename__])
+        create_missing_indexes(conn, [Question.__table__, Comment.__table__])
+    print('Score backfill complete.')
+
+# Atualiza o feed hot uma vez (para cron, quando HOT_FEED_REFRESH_INTERVAL=0);
+# --full confere todas as perguntas, sem a marca d'água:
+#   flask refresh-hot-feed [--full]
+@bp.cli.command('refresh-hot-feed')
+@click.option('--full', is_flag=True, help='Compare every question instead of only recent updates.')
+def refresh_hot_feed_command(full):
+    print('Rescored %d questions.' % refresh_hot_feed(full))
+
+# Limpeza offline (com a aplicação parada): apaga órfãos, recalcula
+# comment_count e compacta/atualiza estatísticas do banco.
+#   flask compact
+@bp.cli.command('compact')
+def compact():
+    purge_orphans()
+    db.session.commit()
+    with db.engine.begin() as conn:
+        fill_comment_counts(conn)
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite':
+        with db.engine.connect() as conn:
+            conn.execute(text('VACUUM'))
+            conn.execute(text('ANALYZE'))
+    elif dialect == 'postgresql':
+        with db.engine.connect() as conn:
+            conn.execution_options(isolation_level='AUTOCOMMIT').execute(text('VACUUM ANALYZE'))
+    else:
+        print('VACUUM/ANALYZE skipped on %s.' % dialect)
+    print('Database compacted.')
+
+# Cria (se faltar) e reconstrói o índice full-text a partir da tabela question:
+#   flask rebuild-search-index
+@bp.cli.command('rebuild-search-index')
+def rebuild_search_index():
+    if db.engine.dialect.name != 'sqlite':
+        print('Full-text index is only available on SQLite.')
+        return
+    with db.engine.begin() as conn:
+        create_search_index(conn)
+        conn.execute(text("INSERT INTO question_fts(question_fts) VALUES ('rebuild')"))
+    print('Search index rebuilt.')
+
+
+# ------------------ APP ------------------
+def create_app(test_config=None):
+    app = Flask(__name__)
+    load_config(app)
+    if test_config:
+        app.config.update(test_config)
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'], app.config)
+    if app.config['DATABASE_READ_URL']:
+        app.config['SQLALCHEMY_BINDS'] = {'read': app.config['DATABASE_READ_URL']}
+
+    cors.init_app(app, resources={r"/*": {"origins": "*"}})
+    api.init_app(app)
+    db.init_app(app)
+    jwt.init_app(app)
+    app.register_blueprint(bp)
+
+    app.extensions['password_hasher'] = PasswordHasher(
+        app.config['PASSWORD_HASH_METHOD'], app.config['HASH_POOL_WORKERS'], app.config['HASH_POOL_MAX_PENDING'])
+    app.extensions['identity_cache'] = MemoryCache(
+        app.config['IDENTITY_CACHE_MAX_ENTRIES'], app.config['IDENTITY_CACHE_TTL'])
+    app.extensions['vote_state_cache'] = MemoryCache(
+        app.config['VOTE_STATE_CACHE_MAX_ENTRIES'], app.config['VOTE_STATE_CACHE_TTL'])
+    app.extensions['response_cache'] = create_response_cache(app.config)
+    app.extensions['image_processor'] = ImageProcessor(app, app.config['IMAGE_POOL_WORKERS'])
+    if app.config['VOTE_BUFFERING']:
+        vote_buffer = VoteBuffer(app, app.config['VOTE_FLUSH_INTERVAL'], app.config['VOTE_BUFFER_MAX'])
+        app.extensions['vote_buffer'] = vote_buffer
+        if app.config['VOTE_FLUSH_ON_SHUTDOWN']:
+            atexit.register(vote_buffer.stop)
+    if app.config['HOT_FEED_REFRESH_INTERVAL'] > 0:
+        hot_feed = HotFeedRefresher(app, app.config['HOT_FEED_REFRESH_INTERVAL'])
+        app.extensions['hot_feed'] = hot_feed
+        atexit.register(hot_feed.stop)
+    app.extensions['metrics'] = Metrics()
+    app.extensions['ready'] = False
+    return app
+
+def warmup(app):
+    """Prepara um worker antes de receber tráfego: abre uma conexão do pool,
+    traz para o cache do SQLite as páginas da listagem principal, sobe o
+    pool de hashing e o job do feed hot. Só depois disso /ready responde 200."""
+    app.extensions['warmup_pid'] = os.getpid()
+    with app.app_context():
+        try:
+            (Question.query.options(joinedload(Question.author))
+             .order_by(Question.score.desc(), Question.id.desc())
+             .limit(DEFAULT_PAGE_SIZE).all())
+        except exc.SQLAlchemyError:
+            app.logger.exception('Warmup failed; worker will report not ready')
+            return False
+        finally:
+            db.session.remove()
+        app.extensions['password_hasher'].warmup()
+    if 'hot_feed' in app.extensions:
+        app.extensions['hot_feed'].start()
+    app.extensions['ready'] = True
+    return True
+
 
 # MAIN PARA EXECUTAR O APP EM PYTHON
 if __name__ == '__main__':
+    app = create_app()
+    warmup(app)
     app.run(debug=True)
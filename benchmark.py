@@ -0,0 +1,678 @@
+# Benchmark da API: popula um banco sintético pelos modelos do app.py, mede
+# cada rota pelo test client do Flask (sequencial, sem rede) e/ou por um
+# gunicorn de verdade com vários clientes concorrentes, e compara com um
+# baseline salvo.
+#
+#   python benchmark.py --scale small --output results.json
+#   python benchmark.py --scale small --mode server --concurrency 16
+#   python benchmark.py --scale small --compare benchmark_baseline.json
+#
+# Para cada cenário: p50/p95/p99 (ms), requisições por segundo, queries por
+# requisição (lidas do header Server-Timing) e contagem de status HTTP.
+from collections import namedtuple
+from datetime import datetime, timedelta
+import argparse
+import base64
+import http.client
+import json
+import os
+import platform
+import random
+import re
+import shutil
+import signal
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from urllib.parse import urlencode
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+SCALES = {
+    'tiny': dict(users=200, questions=1000, comments=3000, votes=10000),
+    'small': dict(users=2000, questions=20000, comments=60000, votes=200000),
+    'medium': dict(users=20000, questions=200000, comments=600000, votes=2000000),
+    'large': dict(users=100000, questions=1000000, comments=3000000, votes=10000000),
+}
+COMMENT_VOTE_SHARE = 0.2  # fração dos votos que vai para comentários
+LIKE_SHARE = 0.8
+SEED_CHUNK = 10000
+PASSWORD = 'benchmark'
+JWT_SECRET = 'benchmark-secret'
+HOT_PATHS = ['get_questions', 'get_questions:viewer', 'search_questions:fts', 'search_questions:prefix',
+             'get_hot_questions', 'get_question', 'get_comments', 'like_question', 'batch_votes']
+WORDS = ('python flask banco dados consulta índice cache votos usuário pergunta resposta servidor '
+         'rede memória disco thread processo fila lote página cursor busca texto ranking feed '
+         'imagem upload token senha sessão conexão pool réplica esquema migração').split()
+# PNG 1x1 para o cenário de upload
+PIXEL_PNG = base64.b64decode(
+    'iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mP8z8BQDwAEhQGAhKmMIQAAAABJRU5ErkJggg==')
+
+Request = namedtuple('Request', 'method path user body content_type')
+Scenario = namedtuple('Scenario', 'name endpoint build')
+
+
+def GET(path, user=None):
+    return Request('GET', path, user, None, None)
+
+
+def send_json(method, path, user, payload):
+    return Request(method, path, user, json.dumps(payload).encode(), 'application/json')
+
+
+def multipart(field, filename, content, mimetype):
+    boundary = uuid.uuid4().hex
+    body = b''.join([
+        b'--%s\r\n' % boundary.encode(),
+        b'Content-Disposition: form-data; name="%s"; filename="%s"\r\n' % (field.encode(), filename.encode()),
+        b'Content-Type: %s\r\n\r\n' % mimetype.encode(),
+        content, b'\r\n--%s--\r\n' % boundary.encode(),
+    ])
+    return body, 'multipart/form-data; boundary=%s' % boundary
+
+
+def configure_environment(args, workdir):
+    """O app lê a configuração do ambiente na importação/create_app."""
+    os.environ.update({
+        'DATABASE_URL': args.database or 'sqlite:///' + os.path.join(workdir, 'benchmark.db'),
+        'JWT_SECRET_KEY': JWT_SECRET,
+        'CACHE_BACKEND': args.cache,
+        'HOT_FEED_REFRESH_INTERVAL': '0',
+        'METRICS_ENABLED': '1',
+    })
+    os.environ.setdefault('HASH_POOL_WORKERS', '2')
+    os.environ.setdefault('IMAGE_POOL_WORKERS', '0')
+
+
+# ------------------ DADOS SINTÉTICOS ------------------
+def question_owner(question_id, users):
+    return (question_id - 1) % users + 1
+
+
+def skewed_id(rng, count):
+    """Sorteia ids concentrados nos primeiros (algumas perguntas recebem a maior parte da atividade)."""
+    return int(count * rng.random() ** 3) + 1
+
+
+def insert_chunks(A, model, rows):
+    table = model.__table__
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= SEED_CHUNK:
+            A.db.session.execute(table.insert(), chunk)
+            A.db.session.commit()
+            chunk = []
+    if chunk:
+        A.db.session.execute(table.insert(), chunk)
+        A.db.session.commit()
+
+
+def vote_rows(rng, users, targets, total, target_column):
+    """Votos únicos por (usuário, alvo), espalhados entre os usuários."""
+    per_user, extra = divmod(total, users)
+    for user_id in range(1, users + 1):
+        count = min(per_user + (1 if user_id <= extra else 0), targets)
+        for target_id in rng.sample(range(1, targets + 1), count):
+            yield {'user_id': user_id, target_column: target_id, 'like': rng.random() < LIKE_SHARE}
+
+
+def seed(A, scale, seed_value):
+    rng = random.Random(seed_value)
+    users, questions, comments, votes = scale['users'], scale['questions'], scale['comments'], scale['votes']
+    now = datetime.utcnow()
+    password_hash = A.generate_password_hash(PASSWORD, os.environ.get('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:260000'))
+    started = time.perf_counter()
+
+    def text(n):
+        return ' '.join(rng.choice(WORDS) for _ in range(n))
+
+    insert_chunks(A, A.User, ({
+        'id': i, 'email': 'user%d@bench.local' % i, 'name': 'User %d' % i, 'age': 18 + i % 50,
+        'password_hash': password_hash, 'profile_picture': 'default_profile_url',
+    } for i in range(1, users + 1)))
+
+    def question_rows():
+        for i in range(1, questions + 1):
+            created = now - timedelta(seconds=rng.randrange(90 * 24 * 3600))
+            yield {'id': i, 'title': text(5)[:100], 'description': text(30)[:500],
+                   'user_id': question_owner(i, users), 'likes': 0, 'dislikes': 0, 'score': 0,
+                   'comment_count': 0, 'created_at': created, 'updated_at': created}
+    insert_chunks(A, A.Question, question_rows())
+
+    def comment_rows():
+        for i in range(1, comments + 1):
+            yield {'id': i, 'content': text(20)[:500], 'question_id': skewed_id(rng, questions),
+                   'user_id': rng.randrange(1, users + 1), 'likes': 0, 'dislikes': 0, 'score': 0,
+                   'created_at': now, 'updated_at': now}
+    insert_chunks(A, A.Comment, comment_rows())
+
+    comment_votes = int(votes * COMMENT_VOTE_SHARE)
+    insert_chunks(A, A.UserQuestionLike, vote_rows(rng, users, questions, votes - comment_votes, 'question_id'))
+    insert_chunks(A, A.UserCommentLike, vote_rows(rng, users, comments, comment_votes, 'comment_id'))
+    insert_chunks(A, A.Bookmark, ({'user_id': u, 'question_id': q}
+                                  for u in range(1, users + 1)
+                                  for q in rng.sample(range(1, questions + 1), min(3, questions))))
+
+    # Contadores derivados, em UPDATEs de conjunto
+    for vote_model, target_model, target_column in A.VOTE_TARGETS.values():
+        votes_table, target = vote_model.__table__, target_model.__table__
+        def counted(like):
+            return (A.select([A.func.count()])
+                    .where((votes_table.c[target_column] == target.c.id) & (votes_table.c.like == like))
+                    .as_scalar())
+        A.db.session.execute(target.update().values(likes=counted(True), dislikes=counted(False)))
+    A.db.session.commit()
+    with A.db.engine.begin() as conn:
+        A.fill_scores(conn, [A.Question.__tablename__, A.Comment.__tablename__])
+        A.fill_comment_counts(conn)
+    A.refresh_hot_feed()
+    print('Seeded %s in %.1fs' % (scale, time.perf_counter() - started), file=sys.stderr)
+
+
+def prepare_database(A, app, args, scale):
+    url = os.environ['DATABASE_URL']
+    with app.app_context():
+        if args.reuse and 'question' in A.inspect(A.db.engine).get_table_names():
+            return
+        if url.startswith('sqlite:///'):
+            A.db.engine.dispose()
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(url[len('sqlite:///'):] + suffix):
+                    os.remove(url[len('sqlite:///'):] + suffix)
+        else:
+            A.db.drop_all()
+        A.db.create_all()
+        seed(A, scale, args.seed)
+
+
+# ------------------ CENÁRIOS ------------------
+class Context:
+    """Estado compartilhado pelos cenários: escala, tokens e acesso direto ao banco."""
+
+    def __init__(self, A, app, scale):
+        self.A = A
+        self.app = app
+        self.users = scale['users']
+        self.questions = scale['questions']
+        self.comments = scale['comments']
+        self.tokens = {}
+        self.lock = threading.Lock()
+        self.questions_cursor = None
+        self.image_path = None
+
+    def token(self, user_id):
+        token = self.tokens.get(user_id)
+        if token is None:
+            with self.app.app_context():
+                token = self.A.create_access_token(identity=user_id)
+            self.tokens[user_id] = token
+        return token
+
+    def scalar(self, statement):
+        with self.app.app_context():
+            try:
+                return self.A.db.session.execute(statement).scalar()
+            finally:
+                self.A.db.session.remove()
+
+    def comment_owner(self, comment_id):
+        comment = self.A.Comment.__table__
+        return self.scalar(self.A.select([comment.c.user_id]).where(comment.c.id == comment_id))
+
+    def latest_comment(self, user_id):
+        comment = self.A.Comment.__table__
+        return self.scalar(self.A.select([self.A.func.max(comment.c.id)]).where(comment.c.user_id == user_id))
+
+    def new_user(self):
+        """Usuário descartável, inserido direto (sem passar pelo hash de senha)."""
+        user = self.A.User.__table__
+        email = 'tmp-%s@bench.local' % uuid.uuid4().hex
+        with self.app.app_context():
+            try:
+                self.A.db.session.execute(user.insert().values(
+                    email=email, name='Temp', age=30, profile_picture='default_profile_url'))
+                self.A.db.session.commit()
+                return self.A.db.session.execute(
+                    self.A.select([user.c.id]).where(user.c.email == email)).scalar()
+            finally:
+                self.A.db.session.remove()
+
+    def setup(self, send):
+        """Dados que os cenários precisam descobrir antes de medir (fora do tempo medido)."""
+        status, body = send(GET('/questions'))
+        self.questions_cursor = body.get('next_cursor') if status == 200 else None
+        payload, content_type = multipart('file', 'avatar.png', PIXEL_PNG, 'image/png')
+        status, body = send(Request('POST', '/upload/1', 1, payload, content_type))
+        self.image_path = body.get('profile_picture') if status in (200, 202) else None
+
+
+def random_user(ctx, rng):
+    return rng.randrange(1, ctx.users + 1)
+
+
+def random_question(ctx, rng):
+    return skewed_id(rng, ctx.questions)
+
+
+def random_comment(ctx, rng):
+    return rng.randrange(1, ctx.comments + 1)
+
+
+def build_delete_question(ctx, rng, send):
+    user = random_user(ctx, rng)
+    _, body = send(send_json('POST', '/questions', user, {'title': 'temp', 'description': 'temp'}))
+    return Request('DELETE', '/questions/%d' % body['id'], user, None, None)
+
+
+def build_delete_comment(ctx, rng, send):
+    user, question = random_user(ctx, rng), random_question(ctx, rng)
+    send(send_json('POST', '/questions/%d/comments' % question, user, {'content': 'temp'}))
+    return Request('DELETE', '/comments/%d' % ctx.latest_comment(user), user, None, None)
+
+
+def build_update_comment(ctx, rng, send):
+    comment = random_comment(ctx, rng)
+    return send_json('PUT', '/comments/%d' % comment, ctx.comment_owner(comment), {'content': 'edited'})
+
+
+def build_retract(kind, pick):
+    def build(ctx, rng, send):
+        user, target = random_user(ctx, rng), pick(ctx, rng)
+        send(Request('POST', '/%ss/%d/like' % (kind, target), user, None, None))
+        return Request('DELETE', '/%ss/%d/vote' % (kind, target), user, None, None)
+    return build
+
+
+def build_remove_bookmark(ctx, rng, send):
+    user, question = random_user(ctx, rng), random_question(ctx, rng)
+    send(Request('POST', '/user/%d/bookmark/%d' % (user, question), user, None, None))
+    return Request('DELETE', '/user/%d/bookmark/%d' % (user, question), user, None, None)
+
+
+def build_batch_votes(ctx, rng, send):
+    votes = [{'type': 'question', 'id': random_question(ctx, rng), 'like': rng.random() < LIKE_SHARE}
+             for _ in range(15)]
+    votes += [{'type': 'comment', 'id': random_comment(ctx, rng), 'like': rng.random() < LIKE_SHARE}
+              for _ in range(5)]
+    return send_json('POST', '/votes', random_user(ctx, rng), {'votes': votes})
+
+
+def build_upload(ctx, rng, send):
+    user = random_user(ctx, rng)
+    payload, content_type = multipart('file', 'avatar.png', PIXEL_PNG, 'image/png')
+    return Request('POST', '/upload/%d' % user, user, payload, content_type)
+
+
+def build_delete_user(ctx, rng, send):
+    user = ctx.new_user()
+    return Request('DELETE', '/user/%d' % user, user, None, None)
+
+
+def user_get(template):
+    def build(ctx, rng, send):
+        user = random_user(ctx, rng)
+        return GET(template % user, user)
+    return build
+
+
+SCENARIOS = [
+    Scenario('get_questions', 'get_questions', lambda ctx, rng, send: GET('/questions')),
+    Scenario('get_questions:page2', 'get_questions',
+             lambda ctx, rng, send: GET('/questions?cursor=%s' % ctx.questions_cursor)),
+    Scenario('get_questions:viewer', 'get_questions',
+             lambda ctx, rng, send: GET('/questions', random_user(ctx, rng))),
+    Scenario('search_questions:fts', 'search_questions',
+             lambda ctx, rng, send: GET('/questions/search?' + urlencode({'q': '%s %s' % (rng.choice(WORDS), rng.choice(WORDS))}))),
+    Scenario('search_questions:prefix', 'search_questions',
+             lambda ctx, rng, send: GET('/questions/search?' + urlencode({'mode': 'prefix', 'q': rng.choice(WORDS)[:3]}))),
+    Scenario('search_questions:title', 'search_questions',
+             lambda ctx, rng, send: GET('/questions/search?' + urlencode({'title': rng.choice(WORDS)}))),
+    Scenario('get_hot_questions', 'get_hot_questions', lambda ctx, rng, send: GET('/questions/hot')),
+    Scenario('get_question', 'get_question',
+             lambda ctx, rng, send: GET('/questions/%d' % random_question(ctx, rng))),
+    Scenario('get_comments', 'get_comments',
+             lambda ctx, rng, send: GET('/questions/%d/comments' % random_question(ctx, rng))),
+    Scenario('add_question', 'add_question',
+             lambda ctx, rng, send: send_json('POST', '/questions', random_user(ctx, rng),
+                                              {'title': 'bench question', 'description': 'bench'})),
+    Scenario('update_question', 'update_question',
+             lambda ctx, rng, send: (lambda q: send_json('PUT', '/questions/%d' % q, question_owner(q, ctx.users),
+                                                         {'description': 'edited'}))(random_question(ctx, rng))),
+    Scenario('delete_question', 'delete_question', build_delete_question),
+    Scenario('like_question', 'like_question',
+             lambda ctx, rng, send: Request('POST', '/questions/%d/like' % random_question(ctx, rng),
+                                            random_user(ctx, rng), None, None)),
+    Scenario('dislike_question', 'dislike_question',
+             lambda ctx, rng, send: Request('POST', '/questions/%d/dislike' % random_question(ctx, rng),
+                                            random_user(ctx, rng), None, None)),
+    Scenario('retract_question_vote', 'retract_question_vote', build_retract('question', random_question)),
+    Scenario('add_comment', 'add_comment',
+             lambda ctx, rng, send: send_json('POST', '/questions/%d/comments' % random_question(ctx, rng),
+                                              random_user(ctx, rng), {'content': 'bench comment'})),
+    Scenario('update_comment', 'update_comment', build_update_comment),
+    Scenario('delete_comment', 'delete_comment', build_delete_comment),
+    Scenario('like_comment', 'like_comment',
+             lambda ctx, rng, send: Request('POST', '/comments/%d/like' % random_comment(ctx, rng),
+                                            random_user(ctx, rng), None, None)),
+    Scenario('dislike_comment', 'dislike_comment',
+             lambda ctx, rng, send: Request('POST', '/comments/%d/dislike' % random_comment(ctx, rng),
+                                            random_user(ctx, rng), None, None)),
+    Scenario('retract_comment_vote', 'retract_comment_vote', build_retract('comment', random_comment)),
+    Scenario('batch_votes', 'batch_votes', build_batch_votes),
+    Scenario('register', 'register',
+             lambda ctx, rng, send: send_json('POST', '/register', None, {
+                 'email': 'new-%s@bench.local' % uuid.uuid4().hex, 'name': 'New', 'age': 20,
+                 'password': PASSWORD, 'confirm_password': PASSWORD})),
+    Scenario('login', 'login',
+             lambda ctx, rng, send: send_json('POST', '/login', None, {
+                 'email': 'user%d@bench.local' % random_user(ctx, rng), 'password': PASSWORD})),
+    Scenario('update_user', 'update_user',
+             lambda ctx, rng, send: (lambda u: send_json('PUT', '/user/%d' % u, u, {'age': 31}))(random_user(ctx, rng))),
+    Scenario('delete_user', 'delete_user', build_delete_user),
+    Scenario('view_bookmarks', 'view_bookmarks', user_get('/user/%d/bookmarks')),
+    Scenario('add_bookmark', 'add_bookmark',
+             lambda ctx, rng, send: (lambda u: Request('POST', '/user/%d/bookmark/%d' % (u, random_question(ctx, rng)),
+                                                       u, None, None))(random_user(ctx, rng))),
+    Scenario('remove_bookmark', 'remove_bookmark', build_remove_bookmark),
+    Scenario('view_history', 'view_history', user_get('/user/%d/history')),
+    Scenario('view_dashboard', 'view_dashboard', user_get('/user/%d/dashboard')),
+    Scenario('upload_file', 'upload_file', build_upload),
+    Scenario('serve_image', 'serve_image', lambda ctx, rng, send: GET(ctx.image_path)),
+    Scenario('metrics', 'metrics', lambda ctx, rng, send: GET('/metrics')),
+    Scenario('db_path', 'db_path', lambda ctx, rng, send: GET('/dbpath')),
+    Scenario('ready', 'ready', lambda ctx, rng, send: GET('/ready')),
+]
+
+
+# ------------------ EXECUÇÃO ------------------
+QUERIES_RE = re.compile(r'desc="(\d+) queries"')
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    rank = max(int(round(pct / 100.0 * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def summarize(samples, wall_time):
+    latencies = sorted(latency for latency, _, _ in samples)
+    queries = [q for _, _, q in samples if q is not None]
+    statuses = {}
+    for _, status, _ in samples:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    return {
+        'count': len(samples),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'rps': round(len(samples) / wall_time, 1) if wall_time > 0 else None,
+        'queries_per_request': round(sum(queries) / len(queries), 2) if queries else None,
+        'errors': sum(n for status, n in statuses.items() if status == 'error' or int(status) >= 500),
+        'statuses': statuses,
+    }
+
+
+def headers_for(ctx, request):
+    headers = {}
+    if request.user is not None:
+        headers['Authorization'] = 'Bearer ' + ctx.token(request.user)
+    if request.content_type:
+        headers['Content-Type'] = request.content_type
+    return headers
+
+
+class TestClientTransport:
+    """Chama o app no próprio processo, sem rede: isola o custo do código e do banco."""
+
+    def __init__(self, ctx):
+        self.ctx = ctx
+        self.client = ctx.app.test_client()
+
+    def __call__(self, request):
+        response = self.client.open(request.path, method=request.method, data=request.body,
+                                    headers=headers_for(self.ctx, request))
+        timing = ','.join(response.headers.getlist('Server-Timing'))
+        return response.status_code, response.get_data(), timing
+
+
+class HTTPTransport:
+    """Uma conexão keep-alive por thread cliente."""
+
+    def __init__(self, ctx, host, port):
+        self.ctx = ctx
+        self.host, self.port = host, port
+        self.local = threading.local()
+
+    def __call__(self, request):
+        for attempt in (1, 2):
+            connection = getattr(self.local, 'connection', None)
+            if connection is None:
+                connection = self.local.connection = http.client.HTTPConnection(self.host, self.port, timeout=60)
+            try:
+                connection.request(request.method, request.path, body=request.body,
+                                   headers=headers_for(self.ctx, request))
+                response = connection.getresponse()
+                body = response.read()
+                return response.status, body, ','.join(response.headers.get_all('Server-Timing') or [])
+            except (http.client.HTTPException, OSError):
+                connection.close()
+                self.local.connection = None
+                if attempt == 2:
+                    raise
+
+
+def json_sender(transport):
+    """send() usado pelos passos de preparação: devolve (status, JSON)."""
+    def send(request):
+        status, body, _ = transport(request)
+        try:
+            return status, json.loads(body or b'{}')
+        except ValueError:
+            return status, {}
+    return send
+
+
+def run_scenario(ctx, transport, scenario, requests, warmup, concurrency, seed_value):
+    send = json_sender(transport)
+    samples, lock = [], threading.Lock()
+    counter = iter(range(warmup + requests))
+
+    def worker(index):
+        rng = random.Random('%s:%s:%d' % (seed_value, scenario.name, index))
+        while True:
+            with lock:
+                n = next(counter, None)
+            if n is None:
+                return
+            request = scenario.build(ctx, rng, send)
+            started = time.perf_counter()
+            try:
+                status, _, timing = transport(request)
+            except (http.client.HTTPException, OSError):
+                status, timing = 'error', ''
+            elapsed = time.perf_counter() - started
+            if n >= warmup:
+                match = QUERIES_RE.search(timing)
+                with lock:
+                    samples.append((elapsed, status, int(match.group(1)) if match else None))
+
+    started = time.perf_counter()
+    if concurrency <= 1:
+        worker(0)
+    else:
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    return summarize(samples, time.perf_counter() - started)
+
+
+def run_suite(ctx, transport, scenarios, args, concurrency, label):
+    ctx.setup(json_sender(transport))
+    results = {}
+    for scenario in scenarios:
+        result = run_scenario(ctx, transport, scenario, args.requests, args.warmup, concurrency, args.seed)
+        results[scenario.name] = result
+        print('[%s] %-26s p50 %8.2f  p95 %8.2f  p99 %8.2f ms  %8.1f req/s  %5s q/req  %s' % (
+            label, scenario.name, result['p50_ms'], result['p95_ms'], result['p99_ms'], result['rps'] or 0,
+            result['queries_per_request'], result['statuses']), file=sys.stderr)
+    return results
+
+
+def start_server(args, workdir):
+    port = args.port
+    env = dict(os.environ, BIND='127.0.0.1:%d' % port, WEB_WORKERS=str(args.workers),
+               PYTHONPATH=REPO_DIR + os.pathsep + os.environ.get('PYTHONPATH', ''))
+    log = open(os.path.join(workdir, 'gunicorn.log'), 'wb')
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', os.path.join(REPO_DIR, 'gunicorn.conf.py'), 'app:create_app()'],
+        cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT)
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise SystemExit('gunicorn exited early; see %s' % log.name)
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+            connection.request('GET', '/ready')
+            if connection.getresponse().status == 200:
+                return process
+        except OSError:
+            pass
+        time.sleep(0.5)
+    process.terminate()
+    raise SystemExit('gunicorn did not become ready; see %s' % log.name)
+
+
+def stop_server(process):
+    process.send_signal(signal.SIGTERM)
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+# ------------------ COMPARAÇÃO ------------------
+def compare(baseline, current, threshold, min_delta_ms, names=None):
+    """Lista regressões: p95 acima do limite ou mais queries por requisição."""
+    regressions = []
+    for mode, results in current['results'].items():
+        base_results = baseline.get('results', {}).get(mode, {})
+        for name, result in results.items():
+            base = base_results.get(name)
+            if base is None or (names and name not in names):
+                continue
+            slower = (result['p95_ms'] > base['p95_ms'] * (1 + threshold)
+                      and result['p95_ms'] - base['p95_ms'] > min_delta_ms)
+            more_queries = (result['queries_per_request'] is not None and base['queries_per_request'] is not None
+                            and result['queries_per_request'] > base['queries_per_request'] + 0.5)
+            change = (result['p95_ms'] / base['p95_ms'] - 1) * 100 if base['p95_ms'] else 0.0
+            flag = 'REGRESSION' if slower or more_queries else 'ok'
+            print('%-6s %-26s p95 %8.2f -> %8.2f ms (%+6.1f%%)  q/req %5s -> %5s  %s' % (
+                mode, name, base['p95_ms'], result['p95_ms'], change,
+                base['queries_per_request'], result['queries_per_request'], flag))
+            if flag != 'ok':
+                regressions.append((mode, name))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark das rotas da API.')
+    parser.add_argument('--scale', choices=sorted(SCALES), default='small')
+    parser.add_argument('--users', type=int)
+    parser.add_argument('--questions', type=int)
+    parser.add_argument('--comments', type=int)
+    parser.add_argument('--votes', type=int)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--database', help='URL do banco (padrão: SQLite em --workdir)')
+    parser.add_argument('--workdir', default=os.path.join(REPO_DIR, '.benchmark'),
+                        help='diretório do banco, uploads e log do servidor')
+    parser.add_argument('--reuse', action='store_true', help='não repopula um banco já existente')
+    parser.add_argument('--mode', choices=['client', 'server', 'both'], default='client')
+    parser.add_argument('--requests', type=int, default=200, help='requisições medidas por cenário')
+    parser.add_argument('--warmup', type=int, default=10, help='requisições descartadas por cenário')
+    parser.add_argument('--concurrency', type=int, default=8, help='clientes simultâneos no modo server')
+    parser.add_argument('--workers', type=int, default=4, help='workers do gunicorn no modo server')
+    parser.add_argument('--port', type=int, default=5099)
+    # Sem cache por padrão: as listagens medem as consultas, não acertos de cache
+    parser.add_argument('--cache', choices=['memory', 'redis', 'none'], default='none',
+                        help='CACHE_BACKEND do app (padrão none)')
+    parser.add_argument('--only', help='cenários separados por vírgula; "hot" inclui os caminhos críticos')
+    parser.add_argument('--output', help='grava o resultado em JSON (use como baseline)')
+    parser.add_argument('--compare', help='baseline JSON; sai com código 1 se houver regressão')
+    parser.add_argument('--threshold', type=float, default=0.25, help='aumento tolerado do p95 (0.25 = 25%%)')
+    parser.add_argument('--min-delta-ms', type=float, default=1.0, help='diferença mínima de p95 para contar')
+    args = parser.parse_args()
+
+    scale = dict(SCALES[args.scale])
+    scale.update({k: getattr(args, k) for k in scale if getattr(args, k) is not None})
+    workdir = os.path.abspath(args.workdir)
+    os.makedirs(workdir, exist_ok=True)
+    configure_environment(args, workdir)
+    sys.path.insert(0, REPO_DIR)
+    os.chdir(workdir)  # uploads (UPLOAD_FOLDER relativo) ficam no diretório do benchmark
+    if not args.reuse:
+        shutil.rmtree(os.path.join(workdir, 'users-profiles'), ignore_errors=True)
+
+    import app as A
+    app = A.create_app()
+    prepare_database(A, app, args, scale)
+    A.warmup(app)
+    ctx = Context(A, app, scale)
+
+    endpoints = {rule.endpoint.split('.', 1)[1] for rule in app.url_map.iter_rules() if rule.endpoint.startswith('main.')}
+    missing = endpoints - {s.endpoint for s in SCENARIOS}
+    if missing:
+        print('Routes without a scenario: %s' % ', '.join(sorted(missing)), file=sys.stderr)
+    names = None
+    if args.only:
+        names = set()
+        for name in args.only.split(','):
+            names.update(HOT_PATHS if name == 'hot' else [name])
+    scenarios = [s for s in SCENARIOS if names is None or s.name in names]
+
+    results = {}
+    if args.mode in ('client', 'both'):
+        results['client'] = run_suite(ctx, TestClientTransport(ctx), scenarios, args, 1, 'client')
+    if args.mode in ('server', 'both'):
+        server = start_server(args, workdir)
+        try:
+            transport = HTTPTransport(ctx, '127.0.0.1', args.port)
+            results['server'] = run_suite(ctx, transport, scenarios, args, args.concurrency, 'server')
+        finally:
+            stop_server(server)
+
+    report = {
+        'meta': {
+            'scale': scale, 'seed': args.seed, 'requests': args.requests, 'warmup': args.warmup,
+            'concurrency': args.concurrency, 'workers': args.workers, 'cache': args.cache,
+            'database': A.make_url(os.environ['DATABASE_URL']).drivername,
+            'python': platform.python_version(), 'platform': platform.platform(),
+            'created_at': datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(os.path.join(REPO_DIR, args.output) if not os.path.isabs(args.output) else args.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+            f.write('\n')
+    if args.compare:
+        path = args.compare if os.path.isabs(args.compare) else os.path.join(REPO_DIR, args.compare)
+        with open(path) as f:
+            baseline = json.load(f)
+        if baseline.get('meta', {}).get('scale') != scale:
+            print('Warning: baseline was recorded at scale %s' % baseline.get('meta', {}).get('scale'), file=sys.stderr)
+        if baseline.get('meta', {}).get('cache') != args.cache:
+            print('Warning: baseline was recorded with --cache %s' % baseline.get('meta', {}).get('cache'), file=sys.stderr)
+        regressions = compare(baseline, report, args.threshold, args.min_delta_ms, names)
+        if regressions:
+            print('%d regression(s): %s' % (len(regressions), ', '.join('%s/%s' % r for r in regressions)))
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+# Configuração do Gunicorn para produção:
+#   flask migrate
+#   gunicorn -c gunicorn.conf.py "app:create_app()"
+#
+# O app é carregado uma vez no processo master (preload_app) e cada worker
+# abre suas próprias conexões depois do fork. Cada worker faz o warmup
+# antes de aceitar conexões, e /ready só responde 200 depois disso.
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+bind = os.environ.get('BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('WEB_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+worker_class = 'gthread'
+threads = int(os.environ.get('WEB_THREADS', '4'))
+keepalive = int(os.environ.get('WEB_KEEPALIVE', '5'))  # segundos
+timeout = int(os.environ.get('WEB_TIMEOUT', '30'))
+graceful_timeout = int(os.environ.get('WEB_GRACEFUL_TIMEOUT', '30'))
+# Recicla workers aos poucos para conter crescimento de memória
+max_requests = int(os.environ.get('WEB_MAX_REQUESTS', '10000'))
+max_requests_jitter = int(os.environ.get('WEB_MAX_REQUESTS_JITTER', '1000'))
+preload_app = True
+accesslog = '-'
+
+# Os pools de processos (hash de senhas e imagens) são por worker: por padrão
+# as CPUs são divididas entre os workers em vez de cada um subir um pool
+# do tamanho da máquina.
+pool_size = str(max(1, multiprocessing.cpu_count() // workers))
+os.environ.setdefault('HASH_POOL_WORKERS', pool_size)
+os.environ.setdefault('IMAGE_POOL_WORKERS', pool_size)
+
+# Métricas do prometheus_client somadas entre os workers: cada worker grava
+# os valores em arquivos neste diretório e qualquer um deles responde /metrics
+# com o total. Precisa estar no ambiente antes de o app ser importado.
+metrics_dir = os.environ.setdefault(
+    'PROMETHEUS_MULTIPROC_DIR', os.path.join(tempfile.gettempdir(), 'app-metrics-%d' % os.getpid()))
+
+
+def on_starting(server):
+    # Arquivos de uma execução anterior somariam contadores antigos
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir)
+
+
+def post_worker_init(worker):
+    from app import warmup
+    warmup(worker.wsgi)
+
+
+def child_exit(server, worker):
+    # Os contadores do worker encerrado continuam somando, mas no arquivo morto
+    # comum: o número de arquivos lidos por coleta não cresce com as reciclagens
+    from app import archive_worker_metrics
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
+    archive_worker_metrics(worker.pid)
+
+
+def on_exit(server):
+    shutil.rmtree(metrics_dir, ignore_errors=True)